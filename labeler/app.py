@@ -1,10 +1,8 @@
 import os
-import sys
 import json
 import ctypes
 import tkinter as tk
 from tkinter import ttk, filedialog, Canvas, Menu, messagebox
-from PIL import Image, ImageTk
 from random import choice
 from string import hexdigits
 
@@ -15,6 +13,16 @@ from .utils.data_analysis import plot_from_labels, plot_from_file, plot_from_csv
 from .utils.mnist_loader import load_mnist
 from .utils.styles import widget_styles
 from .utils.label_parser import LabelParser
+from .utils.thumbnail_cache import ThumbnailCache
+from .utils.image_loader import load_image
+from .utils.folder_cache import FolderState, FolderStateCache
+from .utils.dir_index import directory_index
+from .utils.watcher import FolderWatcher
+from .utils.preview_cache import PreviewCache
+from .utils.label_journal import SET, UNSET
+from .utils.label_store import open_label_store, is_sqlite_path
+from .utils.label_table import LabelTable
+from .utils.gallery import VirtualGallery
 from.utils.resource import resource
 
 
@@ -40,26 +48,42 @@ class ImageLabelerApp:
         self.GALLERY_WIDTH = 1000
         self.INFO_HEIGHT = 860
         self.INFO_WIDTH = 410
-
-        self.MAX_IMAGES = 4900
+        self.PREVIEW_SIZE = self.INFO_WIDTH - 20
 
         self.IMG_SIZE = 170
         self.IMG_PER_ROW = 5
         self.IMG_PAD_X = 5
         self.IMG_PAD_Y = 5
+        self.IMG_BORDER = 3
 
         self.ASSETS_FOLDER_BG = 'labeler/assets/gallery_folder_bg.png'
+        self.THUMBNAIL_CACHE_NAME = '.thumbnails.db'
+        self.FOLDER_CACHE_BUDGET = 256 * 1024 * 1024
+        self.LABELS_COMPACT_INTERVAL = 60 * 1000
 
         self.folder = ""
         self.project = None
         self.selected_index = None
         self.image_files = []
-        self.labeled_files = {}
+        self.labeled_files = LabelTable()
         self.classes = []
         self.class_to_index = {}
         self.index_to_class = {}
         self.class_color_map = {}
+        self.thumbnail_cache = None
+        self.folder_tile_images = {}
+        self.folder_cache = FolderStateCache(self.FOLDER_CACHE_BUDGET)
+        self.folder_watcher = FolderWatcher(self.root, self.__on_folder_changes)
+        self.preview_cache = PreviewCache(self.root, self.__load_thumbnail, self.PREVIEW_SIZE)
+        self.info_panel_widgets = {}
+        self.label_store = None
+        self.gallery_folder = None
+        self.gallery_folder_mtime = None
+        self.folder_cache_root = None
+        self.restored_folder_state = None
+        self.config_signature = None
         self.save_copy_check = tk.BooleanVar(value=True)
+        self.gallery_atlas_check = tk.BooleanVar(value=False)
 
         # UI Layout
         self.gallery_container = tk.Frame(self.root, width=self.GALLERY_WIDTH, height=self.GALLERY_HEIGHT)
@@ -68,11 +92,20 @@ class ImageLabelerApp:
         self.canvas = Canvas(self.gallery_container, width=self.GALLERY_WIDTH, height=self.GALLERY_HEIGHT, background=colors['gray'])
         self.scrollbar = ttk.Scrollbar(self.gallery_container, orient="vertical", command=self.canvas.yview)
 
-        self.gallery_frame = tk.Frame(self.canvas, background=colors['gray'])
-        self.gallery_frame.bind("<Configure>", lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all")))
-
-        self.canvas.create_window((0, 0), window=self.gallery_frame, anchor="nw")
-        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+        self.gallery = VirtualGallery(
+            self.canvas,
+            self.GALLERY_WIDTH,
+            self.__load_thumbnail,
+            self.select_image,
+            self.__open_folder,
+            self.__get_tile_color,
+            on_idle=self.__flush_thumbnail_cache,
+            on_selection_change=self.__on_selection_change,
+            background=colors['gray'],
+            border=self.IMG_BORDER,
+            atlas=self.gallery_atlas_check.get()
+        )
+        self.gallery.attach_scrollbar(self.scrollbar)
 
         self.canvas.pack(side="left", fill="both", expand=True)
         self.scrollbar.pack(side="right", fill="y")
@@ -103,57 +136,93 @@ class ImageLabelerApp:
 
         self.initToolbar()
 
+        self.root.bind("<Control-a>", lambda e: self.select_all_images())
+        self.root.bind("<Escape>", lambda e: self.gallery.clear_selection())
+        self.root.protocol("WM_DELETE_WINDOW", self.__on_close)
+        self.root.after(self.LABELS_COMPACT_INTERVAL, self.__compact_labels_periodically)
+
 
     def __on_mousewheel(self, event):
         self.canvas.yview_scroll(int(-1 * (event.delta / 120)), "units")
 
     
-    def __restart_programm(self):
-        python = sys.executable
-        os.execl(python, python, *sys.argv)
+    def __on_close(self):
+        # background work is stopped first so no after() callback runs against destroyed widgets
+        self.folder_watcher.stop()
+        self.gallery.close()
+        self.preview_cache.close()
+        if self.label_store is not None:
+            if self.label_store.pending:
+                self.save_labels()
+            self.label_store.close()
+        if self.thumbnail_cache is not None:
+            self.thumbnail_cache.close()
+        self.root.destroy()
+
+
+    def __compact_labels_periodically(self):
+        if self.label_store is not None and self.label_store.pending:
+            self.save_labels()
+        self.root.after(self.LABELS_COMPACT_INTERVAL, self.__compact_labels_periodically)
+
 
     
     def __clear_info_frame(self, clear_gallery=True):
-        try:
-            self.image_extension_label.place_forget()
-            self.image_size_label.place_forget()
-        except Exception:
-            pass
-        try:
-            self.image_info_label.place_forget()
-            self.image_name_label.place_forget()
-        except Exception:
-            pass
-        try:
-            self.classes_not_set_label.place_forget()
-        except Exception:
-            pass
-        try:
-            self.crop_save_copy_check.place_forget()
-            self.crop_image_button.place_forget()
-            self.classes_select_label.place_forget()
-            self.classes_select.place_forget()
-        except Exception:
-            pass
-        try:
-            self.info_label.place_forget()
-            self.info_label = tk.Label(self.info_frame, text="Выберите изображение")
-            self.info_label.configure(widget_styles['label_bold'])
-            self.info_label.place(x=self.INFO_WIDTH // 2 - 50, y=self.INFO_HEIGHT // 2)
-        except:
-            pass
-        try:
-            self.classes_select.place_forget()
-        except Exception:
-            pass
+        for widget in self.info_panel_widgets:
+            widget.place_forget()
+        self.info_label.configure(text="Выберите изображение")
+        self.info_label.place(x=self.INFO_WIDTH // 2 - 90, y=self.INFO_HEIGHT // 2)
         if clear_gallery:
-            try:
-                for widget in self.gallery_frame.winfo_children():
-                    widget.destroy()
-            except Exception:
-                pass
+            self.gallery.clear()
+
+
+    def __build_info_panel(self):
+        if self.info_panel_widgets:
+            return
+        IMG_size = self.PREVIEW_SIZE
+
+        self.preview_label = tk.Label(self.info_frame, background=colors['gray'])
+        self.classes_not_set_label = tk.Label(self.info_frame, text="Не настроены классы для разметки", font=("Arial", 12), background=colors['gray'])
+
+        self.crop_image_button = tk.Button(self.info_frame, text="Обрезать Изображение", command=self.crop_image)
+        self.crop_image_button.configure(widget_styles['button_flat'])
+        self.crop_save_copy_check = tk.Checkbutton(self.info_frame, text="Сохранить копию", font=("Arial", 12), variable=self.save_copy_check, onvalue=True, offvalue=False, background=colors['gray'])
+
+        self.classes_select_label = tk.Label(self.info_frame, text="Выберите класс")
+        self.classes_select_label.configure(widget_styles['label_bold'])
+        self.classes_select = ttk.Combobox(self.info_frame, values=[' '] + self.classes, state="readonly")
+        self.classes_select.bind("<<ComboboxSelected>>", self.save_label)
+
+        self.image_info_label = tk.Label(self.info_frame, text="Информация об изображении")
+        self.image_info_label.configure(widget_styles['label_bold'])
+        self.image_name_label = tk.Label(self.info_frame, font=("Arial", 10), background=colors['gray'])
+        self.image_extension_label = tk.Label(self.info_frame, font=("Arial", 10), background=colors['gray'])
+        self.image_size_label = tk.Label(self.info_frame, font=("Arial", 10), background=colors['gray'])
+        self.selection_count_label = tk.Label(self.info_frame, font=("Arial", 12), background=colors['gray'])
+
+        self.info_panel_widgets = {
+            self.preview_label: {"x": 10, "y": 10},
+            self.classes_not_set_label: {"x": 10, "y": IMG_size + 20},
+            self.crop_image_button: {"x": 10, "y": IMG_size + 20},
+            self.crop_save_copy_check: {"x": 10, "y": IMG_size + 60},
+            self.classes_select_label: {"x": 10, "y": IMG_size + 100},
+            self.classes_select: {"x": 10, "y": IMG_size + 130, "width": self.INFO_WIDTH - 20},
+            self.image_info_label: {"x": 10, "y": IMG_size + 170},
+            self.image_name_label: {"x": 10, "y": IMG_size + 210},
+            self.image_extension_label: {"x": 10, "y": IMG_size + 240},
+            self.image_size_label: {"x": 10, "y": IMG_size + 270},
+            self.selection_count_label: {"x": 10, "y": IMG_size + 60},
+        }
+
+
+    def __show_info_widgets(self, *widgets):
+        for widget in self.info_panel_widgets:
+            if widget in widgets:
+                widget.place(**self.info_panel_widgets[widget])
+            else:
+                widget.place_forget()
+
 
-    
     def __reload_app_state(self, place_forget=False, dump_project_data=False):
         if place_forget:
             self.welcome_label.place_forget()
@@ -165,28 +234,92 @@ class ImageLabelerApp:
             if not os.path.exists(self.project["config"]):
                 with open(self.project["config"], "w", encoding="utf-8") as f:
                     json.dump({}, f, ensure_ascii=False, indent=4)
-            if not os.path.exists(self.project["labels"]):
+            if not os.path.exists(self.project["labels"]) and not is_sqlite_path(self.project["labels"]):
                 with open(self.project["labels"], "w", encoding="utf-8") as f:
                     json.dump({}, f, ensure_ascii=False, indent=4)
 
+        self.__remember_folder_state()
+        if self.folder_cache_root != self.initial_folder:
+            self.folder_cache.invalidate()
+            self.folder_cache_root = self.initial_folder
         self.selected_index = None
         self.image_files = []
         self.__clear_info_frame()
+        self.preview_cache.invalidate()
 
-        self.load_class_config()
-        self.labeled_files = {}
-        self.info_label.place_forget()
-        self.info_label.place(x=self.INFO_WIDTH // 2 - 90, y=self.INFO_HEIGHT // 2)
-        self.info_label.config(text="Выберите изображение")
-        self.load_existing_labels()
+        config_signature = (self.config_path, self.__file_signature(self.config_path))
+        if config_signature != self.config_signature:
+            self.load_class_config()
+            self.config_signature = config_signature
+
+        store = self.label_store
+        if store is None or store.labels_path != self._labels_path() or store.changed():
+            if store is not None:
+                store.close()
+            self.labeled_files = LabelTable()
+            self.load_existing_labels()
+
+        self.__open_thumbnail_cache()
         self.load_nested_folders(self.folder)
         self.load_images(self.folder)
 
 
+    def __file_signature(self, path : str):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+
+    def __remember_folder_state(self):
+        if self.gallery_folder is None or not self.gallery.count():
+            return
+        thumbnails, scroll = self.gallery.snapshot()
+        state = FolderState(self.gallery_folder_mtime, self.nested_folders, self.image_files, thumbnails, scroll)
+        self.folder_cache.put(self.gallery_folder, state)
+        self.gallery_folder = None
+
+
+    def _labels_path(self):
+        if not self.project:
+            return os.path.join(self.folder, "labels.json")
+        return self.project["labels"]
+
+
+    def __open_thumbnail_cache(self):
+        cache_root = self.project["root"] if self.project else self.initial_folder
+        cache_path = os.path.join(cache_root, self.THUMBNAIL_CACHE_NAME)
+        if self.thumbnail_cache is not None:
+            if self.thumbnail_cache.db_path == cache_path:
+                return
+            self.thumbnail_cache.close()
+            self.thumbnail_cache = None
+        try:
+            self.thumbnail_cache = ThumbnailCache(cache_path)
+        except Exception:
+            pass
+
+
+    def __load_thumbnail(self, image_path : str, size : int):
+        if self.thumbnail_cache is None:
+            return load_image(image_path, (size, size))
+        return self.thumbnail_cache.load(image_path, size)
+
+
+    def __flush_thumbnail_cache(self):
+        if self.thumbnail_cache is not None:
+            self.thumbnail_cache.flush()
+
+
+    def __get_tile_color(self, index : int):
+        return self.__get_image_bg_color(os.path.relpath(self.image_files[index], self.initial_folder))
+
+
     def __get_image_bg_color(self, image_name : str):
         image_bg_color = "#FFFFFF"
         try:
-            image_bg_color = self.class_color_map[self.index_to_class[int(self.labeled_files[image_name])]]
+            image_bg_color = self.class_color_map[self.index_to_class[self.labeled_files[image_name]]]
         except KeyError:
             pass
         return image_bg_color
@@ -203,6 +336,10 @@ class ImageLabelerApp:
         projectMenu = Menu(menubar)
         projectMenu.add_command(label="Открыть проект", underline=0, command=self.open_project)
         projectMenu.add_command(label="Настройки проекта", underline=0, command=self.configure_project)
+        projectMenu.add_separator()
+        projectMenu.add_command(label="Хранить метки в SQLite", underline=0, command=self.convert_labels_to_sqlite)
+        projectMenu.add_command(label="Импорт меток из JSON", underline=0, command=self.import_labels_json)
+        projectMenu.add_command(label="Экспорт меток в JSON", underline=0, command=self.export_labels_json)
         menubar.add_cascade(label="Проект", underline=0, menu=projectMenu)
 
         classMenu = Menu(menubar)
@@ -212,9 +349,20 @@ class ImageLabelerApp:
         classMenu.add_command(label="Определить классы по папкам", underline=0, command=self.create_labels_from_folders)
         menubar.add_cascade(label="Настройка классов", underline=0, menu=classMenu)
 
+        selectionMenu = Menu(menubar)
+        selectionMenu.add_command(label="Выделить все", underline=0, accelerator="Ctrl+A", command=self.select_all_images)
+        selectionMenu.add_command(label="Снять выделение", underline=0, accelerator="Esc", command=self.gallery.clear_selection)
+        menubar.add_cascade(label="Выделение", underline=0, menu=selectionMenu)
+
+        viewMenu = Menu(menubar)
+        viewMenu.add_checkbutton(label="Атлас миниатюр", underline=0, variable=self.gallery_atlas_check, onvalue=True, offvalue=False, command=lambda: self.gallery.set_atlas(self.gallery_atlas_check.get()))
+        menubar.add_cascade(label="Вид", underline=0, menu=viewMenu)
+
         exportMenu = Menu(menubar)
         exportMenu.add_command(label="Экспорт папки в txt", underline=0, command=self.export_to_txt)
         exportMenu.add_command(label="Экспорт папки в csv", underline=0, command=self.export_to_csv)
+        exportMenu.add_command(label="Экспорт папки в NumPy (.npy)", underline=0, command=self.export_to_npy)
+        exportMenu.add_command(label="Экспорт папки в IDX", underline=0, command=self.export_to_idx)
         menubar.add_cascade(label="Экспорт", underline=0, menu=exportMenu)
 
         premadeDatasetMenu = Menu(menubar)
@@ -317,7 +465,7 @@ class ImageLabelerApp:
                 if is_folder:
                     path = filedialog.askdirectory()
                 else:
-                    path = filedialog.askopenfilename(filetypes=[("JSON", "*.json")])
+                    path = filedialog.askopenfilename(filetypes=[("JSON", "*.json"), ("SQLite", "*.db")])
                 if path:
                     entry.delete(0, tk.END)
                     entry.insert(0, path)
@@ -376,16 +524,79 @@ class ImageLabelerApp:
             messagebox.showerror("Ошибка!", repr(e))
 
 
+    def convert_labels_to_sqlite(self):
+        if not self.project:
+            messagebox.showwarning("Предупреждение", "Проект не открыт")
+            return
+        if is_sqlite_path(self.project["labels"]):
+            messagebox.showinfo("Информация", "Метки проекта уже хранятся в SQLite")
+            return
+
+        db_path = os.path.splitext(self.project["labels"])[0] + ".db"
+        try:
+            store = open_label_store(db_path)
+            store.replace(self.labeled_files)
+            if os.path.exists(self.config_path):
+                with open(self.config_path, "r", encoding="utf-8") as f:
+                    store.set_classes(json.load(f))
+            store.close()
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Не удалось перенести метки: {e}")
+            return
+
+        self.save_labels()
+        self.project["labels"] = db_path
+        self._update_project_data()
+        self.__reload_app_state()
+        messagebox.showinfo("Успех", f"Метки перенесены в {os.path.basename(db_path)}.\nJSON остаётся доступен через экспорт.")
+
+
+    def import_labels_json(self):
+        if self.label_store is None:
+            messagebox.showwarning("Предупреждение", "Папка не выбрана")
+            return
+        file_path = filedialog.askopenfilename(filetypes=[("JSON", "*.json")])
+        if not file_path:
+            return
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                self.labeled_files = LabelTable.from_items(json.load(f))
+            self.label_store.replace(self.labeled_files)
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Не удалось импортировать метки: {e}")
+            return
+        self.gallery.refresh()
+
+
+    def export_labels_json(self):
+        if self.label_store is None:
+            messagebox.showwarning("Предупреждение", "Папка не выбрана")
+            return
+        file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON", "*.json")])
+        if not file_path:
+            return
+        try:
+            self.label_store.export_json(file_path, self.labeled_files)
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Не удалось экспортировать метки: {e}")
+
+
     def load_class_config(self):
         if os.path.exists(self.config_path):
             with open(self.config_path, "r", encoding="utf-8") as f:
-                config = json.load(f)
-                self.classes = list(config.keys())
-                self.class_to_index = {str(name): i for i, name in enumerate(self.classes)}
-                self.index_to_class = {i: str(name) for i, name in enumerate(self.classes)}
-                self.class_color_map = {name : config[name]['color'] for name in config}
+                self.__apply_class_config(json.load(f))
         else:
-            self.classes = []
+            self.__apply_class_config({})
+
+
+    def __apply_class_config(self, config : dict):
+        self.classes = list(config.keys())
+        self.class_to_index.clear()
+        self.class_to_index.update({str(name): i for i, name in enumerate(self.classes)})
+        self.index_to_class.clear()
+        self.index_to_class.update({i: str(name) for i, name in enumerate(self.classes)})
+        self.class_color_map.clear()
+        self.class_color_map.update({name : config[name]['color'] for name in config})
 
         
     def create_class_config(self):
@@ -419,8 +630,6 @@ class ImageLabelerApp:
 
         hint_text = tk.Label(self.class_window, text="Чтобы удалить класс, оставьте поле пустым", font=("Arial", 8), foreground="gray")
         hint_text.pack(pady=10)
-        hint_text2 = tk.Label(self.class_window, text="Для применения изменений программа перезапустится", font=("Arial", 8), foreground="#FAA0A0")
-        hint_text2.pack(pady=5, side=tk.BOTTOM)
         save_button = tk.Button(self.class_window, text="Сохранить", command=lambda: self.save_classes())
         save_button.configure(widget_styles['button_flat_green'])
         save_button.pack(pady=5, side=tk.BOTTOM)
@@ -434,35 +643,64 @@ class ImageLabelerApp:
 
     def save_classes(self):
         class_mapping = {}
-        for i, entry in enumerate(self.class_entries):
-            class_name = entry.get().strip()
+        remap = {}
+        old_count = len(self.classes)
+        entered = [entry.get().strip() for entry in self.class_entries]
+        for i, class_name in enumerate(entered):
             if not class_name:
                 continue
-            
-            class_color = self.class_color_map.get(class_name, None)
-            if class_color is not None:
-                self.class_color_map[class_name] = class_color
-            elif len(self.class_color_map) < 30:
-                class_color = choice(list(set(list(random_colors)) - set([x['color'] for x in class_mapping.values()])))
+
+            # a known name keeps its labels and colour wherever it moved, a new name typed over
+            # a prefilled class that is no longer listed renames that class
+            if class_name in self.class_to_index:
+                old_name = class_name
+            elif i < len(self.classes) and self.classes[i] not in entered:
+                old_name = self.classes[i]
             else:
-                class_color = f'#{"".join(choice(hexdigits).lower() for _ in range(6))}'
+                old_name = None
+            class_color = self.class_color_map.get(old_name)
+            if class_color is None:
+                used_colors = set(x['color'] for x in class_mapping.values()).union(self.class_color_map.values())
+                free_colors = list(set(random_colors) - used_colors)
+                if free_colors:
+                    class_color = choice(free_colors)
+                else:
+                    class_color = f'#{"".join(choice(hexdigits).lower() for _ in range(6))}'
 
-            class_mapping[class_name] = {
-                "index": i,
-                "color": class_color
-            }
-        
-        if class_mapping:
-            self.classes = list(class_mapping.keys())
-            self.class_to_index = {str(name): i for i, name in enumerate(self.classes)}
-            self.index_to_class = {i: str(name) for i, name in enumerate(self.classes)}
+            if class_name not in class_mapping:
+                class_mapping[class_name] = {
+                    "index": len(class_mapping),
+                    "color": class_color
+                }
+            if old_name is not None:
+                remap[self.class_to_index[old_name]] = class_mapping[class_name]["index"]
+
+        if not class_mapping:
+            self.class_window.destroy()
+            return
+
+        visible = self.gallery.visible_indices()
+        colors_before = [self.__get_tile_color(index) for index in visible]
+
+        try:
             with open(self.config_path, "w", encoding="utf-8") as f:
                 json.dump(class_mapping, f, ensure_ascii=False, indent=4)
-            self.class_window.destroy()
-            # self.setup_ui()
-            self.load_images(self.folder)
-        
-        self.__restart_programm()
+            self.config_signature = (self.config_path, self.__file_signature(self.config_path))
+            self.__apply_class_config(class_mapping)
+
+            if len(remap) < old_count or any(old != new for old, new in remap.items()):
+                self.labeled_files.remap(remap)
+                if self.label_store is not None:
+                    self.label_store.remap(remap, self.labeled_files)
+            if self.label_store is not None:
+                self.label_store.set_classes(class_mapping)
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Ошибка при записи в файл: {e}")
+            return
+
+        self.class_window.destroy()
+        self.gallery.refresh_tiles(index for index, color in zip(visible, colors_before) if self.__get_tile_color(index) != color)
+        self.__on_selection_change()
 
 
     def clear_classes(self):
@@ -471,238 +709,243 @@ class ImageLabelerApp:
             return
         if not tk.messagebox.askokcancel("Подтверждение", "Вы уверены, что хотите удалить все классы?"):
             return
-        self.classes = []
-        self.index_to_class = {}
-        self.class_to_index = {}
-        self.class_color_map = {}
+        self.__apply_class_config({})
 
         with open(self.config_path, "w", encoding="utf-8") as f:
-            json.dump(self.index_to_class, f, ensure_ascii=False, indent=4)
+            json.dump({}, f, ensure_ascii=False, indent=4)
+        self.config_signature = (self.config_path, self.__file_signature(self.config_path))
         
-        if self.project is not None:
-            with open(self.project["labels"], "w", encoding="utf-8") as f:
-                json.dump({}, f, ensure_ascii=False, indent=4)
-        else:
-            with open(os.path.join(self.folder, "labels.json"), "w", encoding="utf-8") as f:
-                json.dump({}, f, ensure_ascii=False, indent=4)
+        self.labeled_files = LabelTable()
+        if self.label_store is not None:
+            try:
+                self.label_store.replace(self.labeled_files)
+                self.label_store.set_classes({})
+            except Exception as e:
+                messagebox.showerror("Ошибка", f"Ошибка при записи в файл: {e}")
 
-        self.__restart_programm()
+        self.gallery.refresh()
+        self.__on_selection_change()
         
 
     def load_existing_labels(self):
-        if not self.project: 
-            labels_path = os.path.join(self.folder, "labels.json")
-        else:
-            labels_path = self.project["labels"]
-        if not os.path.exists(labels_path): return
+        labels_path = self._labels_path()
+        self.label_store = None
         try:
-            with open(labels_path, "r", encoding="utf-8") as file:
-                self.labeled_files = json.load(file)
+            self.label_store = open_label_store(labels_path)
+            self.labeled_files = LabelTable.from_items(self.label_store.load())
+            if self.label_store.pending:
+                self.save_labels()
         except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка загрузки labels.json: {e}")
+            messagebox.showerror("Ошибка", f"Ошибка загрузки {os.path.basename(labels_path)}: {e}")
             # print(f"Ошибка загрузки labels.json: {e}")
 
 
     def select_image(self, index):
-        try:
-            self.classes_not_set_label.place_forget()
-        except Exception:
-            pass
+        self.__build_info_panel()
 
-        self.__clear_info_frame(clear_gallery=False)
-        
         image_path = self.image_files[index]
         self.selected_index = index
 
-        IMG_size = self.INFO_WIDTH - 20
-
-        image = Image.open(image_path)
-
-        image_name, image_extension = os.path.basename(self.image_files[self.selected_index]).split('.')
-        im_width, im_height = image.size
-
-        image = image.resize((IMG_size, IMG_size))
-        photo = ImageTk.PhotoImage(image)
+        photo, (im_width, im_height) = self.preview_cache.get(image_path)
+        image_name, image_extension = os.path.splitext(os.path.basename(image_path))
 
         self.info_label.place_forget()
-        self.info_label = tk.Label(self.info_frame, image=photo, background=colors['gray'])
-        self.info_label.place(x=10, y=10)
-        self.info_label.config(image=photo)
-        self.info_label.image = photo
+        self.preview_label.configure(image=photo)
+        self.preview_label.image = photo
 
         if not self.classes:
-            self.classes_not_set_label = tk.Label(self.info_frame, text="Не настроены классы для разметки", font=("Arial", 12), background=colors['gray'])
-            self.classes_not_set_label.place(x=10, y=IMG_size + 20)
-            try:
-                self.classes_select.place_forget()
-            except Exception:
-                pass
+            self.__show_info_widgets(self.preview_label, self.classes_not_set_label)
+            self.preview_cache.prefetch(self.image_files, index)
             return
-        
-        self.crop_image_button = tk.Button(self.info_frame, text="Обрезать Изображение", command=self.crop_image)
-        self.crop_image_button.configure(widget_styles['button_flat'])
-        self.crop_image_button.place(x=10, y=IMG_size + 20)
-        self.crop_save_copy_check = tk.Checkbutton(self.info_frame, text="Сохранить копию", font=("Arial", 12), variable=self.save_copy_check, onvalue=True, offvalue=False, background=colors['gray'])
-        self.crop_save_copy_check.place(x=10, y=IMG_size + 60)
-        
-        self.classes_select_label = tk.Label(self.info_frame, text="Выберите класс")
-        self.classes_select_label.configure(widget_styles['label_bold'])
-        self.classes_select_label.place(x=10, y=IMG_size + 100)
-        self.classes_select = ttk.Combobox(self.info_frame, values=[' '] + self.classes, state="readonly")
-        self.classes_select.place(x=10, y=IMG_size + 130, width=self.INFO_WIDTH - 20)
-        self.classes_select.bind("<<ComboboxSelected>>", self.save_label)
-
-        self.image_info_label = tk.Label(self.info_frame, text="Информация об изображении")
-        self.image_info_label.configure(widget_styles['label_bold'])
-        self.image_info_label.place(x=10, y=IMG_size + 170)
-
-        self.image_name_label = tk.Label(self.info_frame, text=f"Название файла: {image_name}", font=("Arial", 10), background=colors['gray'])
-        self.image_extension_label = tk.Label(self.info_frame, text=f"Расширение: {image_extension}", font=("Arial", 10), background=colors['gray'])
-        self.image_size_label = tk.Label(self.info_frame, text=f"Размер изображения: {im_width}x{im_height}", font=("Arial", 10), background=colors['gray'])
-
-        self.image_name_label.place(x=10, y=IMG_size + 210)
-        self.image_extension_label.place(x=10, y=IMG_size + 240)
-        self.image_size_label.place(x=10, y=IMG_size + 270)
 
+        self.__show_info_widgets(
+            self.preview_label,
+            self.crop_image_button,
+            self.crop_save_copy_check,
+            self.classes_select_label,
+            self.classes_select,
+            self.image_info_label,
+            self.image_name_label,
+            self.image_extension_label,
+            self.image_size_label
+        )
+
+        self.image_name_label.configure(text=f"Название файла: {image_name}")
+        self.image_extension_label.configure(text=f"Расширение: {image_extension[1:]}")
+        self.image_size_label.configure(text=f"Размер изображения: {im_width}x{im_height}")
+
+        self.classes_select.configure(values=[' '] + self.classes)
+        self.classes_select.set("")
         image_name = os.path.relpath(image_path, self.initial_folder)
-        if image_name in self.labeled_files:
-            class_number = self.labeled_files[image_name]
-            self.classes_select.set(self.index_to_class.get(int(class_number), ""))
+        class_number = self.labeled_files.get(image_name)
+        if class_number is not None:
+            self.classes_select.set(self.index_to_class.get(class_number, ""))
+
+        self.preview_cache.prefetch(self.image_files, index)
 
     
     def _set_image_size(self):
         self.IMG_SIZE = 85
-        self.IMG_PER_ROW = self.GALLERY_WIDTH // self.IMG_SIZE - 1
+        self.IMG_PAD_X = 5
+        self.IMG_PAD_Y = 5
         if len(self.image_files) > 500:
             self.IMG_SIZE = 58
             self.IMG_PAD_X = 2
             self.IMG_PAD_Y = 2
-            self.IMG_PER_ROW = 15
-
-        if len(self.image_files) == self.MAX_IMAGES:
-            self.IMG_SIZE = 27
-            self.IMG_PAD_X = 1
-            self.IMG_PAD_Y = 1
-            self.IMG_PER_ROW = 30
+        self.IMG_PER_ROW = self.GALLERY_WIDTH // (self.IMG_SIZE + 2 * (self.IMG_BORDER + self.IMG_PAD_X))
 
 
-    # TODO: async loading and pagination
     def load_images(self, folder_path):
-        pad_x = self.IMG_PAD_X
-        pad_y = self.IMG_PAD_Y
-
+        state = self.restored_folder_state
+        self.restored_folder_state = None
         self._set_image_size()
+        self.gallery.set_items(
+            self.nested_folders,
+            self.image_files,
+            self.IMG_SIZE,
+            self.IMG_PER_ROW,
+            self.IMG_PAD_X,
+            self.IMG_PAD_Y,
+            folder_image=self.folder_tile_images.get(self.IMG_SIZE),
+            thumbnails=state.thumbnails if state is not None else None,
+            scroll=state.scroll if state is not None else 0.0
+        )
 
-        img_per_row = self.IMG_PER_ROW
-        IMG_SIZE = self.IMG_SIZE
 
-        loading_label = tk.Label(self.root, text="Загрузка...", background=colors['gray'], font=("Arial", 12))
-        loading_label.place(x=self.GALLERY_WIDTH // 2 - 20, y=self.GALLERY_HEIGHT // 2 - 20)
-        self.gallery_frame.update_idletasks()
+    def load_nested_folders(self, folder_path):
+        self.folder_watcher.watch(folder_path)
+        self.gallery_folder = folder_path
+        self.restored_folder_state = self.folder_cache.get(folder_path)
+        if self.restored_folder_state is not None:
+            self.gallery_folder_mtime = self.restored_folder_state.mtime
+            self.nested_folders = list(self.restored_folder_state.nested_folders)
+            self.image_files = list(self.restored_folder_state.image_files)
+        else:
+            self.nested_folders = directory_index.folders(folder_path)
+            self.image_files = directory_index.images(folder_path)
+            self.gallery_folder_mtime = directory_index.mtime(folder_path)
+            if self.thumbnail_cache is not None:
+                self.thumbnail_cache.evict_stale(folder_path, self.image_files)
 
-        for idx, image_name in enumerate(self.image_files, start=len(self.nested_folders)):
-            image = Image.open(image_name)
-            image = image.resize((IMG_SIZE, IMG_SIZE))
-            photo = ImageTk.PhotoImage(image)
+            if folder_path != self.initial_folder:
+                self.nested_folders = ['..'] + self.nested_folders
 
-            label = tk.Label(self.gallery_frame, image=photo, width=IMG_SIZE, height=IMG_SIZE)
-            label.image = photo
-            base_image_name = os.path.relpath(image_name, self.initial_folder)
-            image_bg_color = self.__get_image_bg_color(base_image_name)
-            label.configure({"background" : image_bg_color})
-            label.bind("<Button-1>", lambda event, idx=idx-len(self.nested_folders): self.select_image(idx))
-            label.grid(row=idx // img_per_row, column=idx % img_per_row, padx=pad_x, pady=pad_y)
+        self._set_image_size()
 
-        loading_label.destroy()
-        self.gallery_frame.update_idletasks()
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+        if self.nested_folders and self.IMG_SIZE not in self.folder_tile_images:
+            tile_size = (self.IMG_SIZE, self.IMG_SIZE)
+            try:
+                image, _ = load_image(resource(self.ASSETS_FOLDER_BG), tile_size)
+            except Exception as e:
+                image, _ = load_image(self.ASSETS_FOLDER_BG, tile_size)
+            self.folder_tile_images[self.IMG_SIZE] = image
 
 
-    def load_nested_folders(self, folder_path):
-        supported_formats = (".png", ".jpg", ".jpeg", ".bmp", ".gif")
+    def __on_folder_changes(self, folder : str, added : list, removed : list, modified : list, rescan : bool):
+        if folder != self.gallery_folder:
+            return
+        directory_index.invalidate(folder)
+        if rescan:
+            listing = directory_index.images(folder)
+            present = set(self.image_files)
+            added = [path for path in listing if path not in present]
+            removed = list(present.difference(listing))
+
+        if self.thumbnail_cache is not None:
+            self.thumbnail_cache.evict(removed + modified)
+        self.preview_cache.invalidate(removed + modified)
+
+        selected_path = self.image_files[self.selected_index] if self.selected_index is not None else None
+        self.gallery.apply_changes(added, removed, modified)
+        if selected_path is None:
+            return
+        if selected_path in removed:
+            self.selected_index = None
+            self.__clear_info_frame(clear_gallery=False)
+            return
+        self.selected_index = self.image_files.index(selected_path)
+        if selected_path in modified:
+            self.select_image(self.selected_index)
 
-        self.nested_folders = [os.path.join(folder_path, f) for f in os.listdir(folder_path) if os.path.isdir(os.path.join(folder_path, f))]
-        self.image_files = [os.path.join(folder_path, f) for f in os.listdir(folder_path) if f.lower().endswith(supported_formats)]
-        self.image_files = self.image_files[:(min(len(self.image_files), self.MAX_IMAGES))]
 
-        if folder_path != self.initial_folder:
-            self.nested_folders = ['..'] + self.nested_folders
-        
-        self._set_image_size()
+    def __open_folder(self, folder):
+        if folder == "..":
+            self.folder = self.initial_folder
+        else:
+            self.folder = folder
+        self.__reload_app_state(place_forget=True)
 
-        pad_x = self.IMG_PAD_X
-        pad_y = self.IMG_PAD_Y
-        img_per_row = self.IMG_PER_ROW
-        IMG_SIZE = self.IMG_SIZE
 
-        for idx, folder in enumerate(self.nested_folders):
-            try:
-                image = Image.open(resource(self.ASSETS_FOLDER_BG))
-            except Exception as e:
-                image = Image.open(self.ASSETS_FOLDER_BG)
-            image = image.resize((IMG_SIZE, IMG_SIZE))
-            photo = ImageTk.PhotoImage(image) 
-            folder_name = os.path.basename(folder)
-
-            label = tk.Label(
-                self.gallery_frame, 
-                image=photo, 
-                text=folder_name, 
-                compound=tk.CENTER, 
-                bg=colors["gray"], 
-                font=("Arial", 12, "bold"),
-                fg=colors["gray"],
-                width=IMG_SIZE,
-                height=IMG_SIZE
-            )
-
-            label.image = photo
-
-            def on_folder_click(e, folder_name=folder_name):
-                if folder_name == "..":
-                    self.folder = self.initial_folder
-                else:
-                    self.folder = os.path.join(self.folder, folder_name)
-                self.__reload_app_state(place_forget=True)
+    def select_all_images(self):
+        if self.image_files:
+            self.gallery.select_all()
 
-            label.bind("<Button-1>", on_folder_click)
 
-            label.grid(row=idx // img_per_row, column=idx % img_per_row, padx=pad_x, pady=pad_y)
+    def __on_selection_change(self):
+        indices = self.gallery.selected_indices()
+        if len(indices) == 1:
+            self.select_image(indices[0])
+            return
+        self.selected_index = None
+        if not indices:
+            self.__clear_info_frame(clear_gallery=False)
+            return
 
-        self.gallery_frame.update_idletasks()
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+        self.__build_info_panel()
+        self.info_label.place_forget()
+        self.selection_count_label.configure(text=f"Выбрано изображений: {len(indices)}")
+        if not self.classes:
+            self.__show_info_widgets(self.classes_not_set_label, self.selection_count_label)
+            return
+        self.__show_info_widgets(self.selection_count_label, self.classes_select_label, self.classes_select)
+        self.classes_select.configure(values=[' '] + self.classes)
+        self.classes_select.set("")
 
 
     def save_label(self, event):
-        if self.selected_index is None:
+        if len(self.gallery.selection) > 1:
+            indices = self.gallery.selected_indices()
+        elif self.selected_index is not None:
+            indices = [self.selected_index]
+        else:
             return
         class_name = self.classes_select.get()
         class_number = self.class_to_index.get(class_name)
-        image_name = os.path.relpath(self.image_files[self.selected_index], self.initial_folder)
-
-        if class_name == " ":
-            self.labeled_files.pop(os.path.relpath(self.image_files[self.selected_index], self.initial_folder), None)
-        elif class_number is not None:
-            self.labeled_files[image_name] = str(class_number)
-        else:
+        if class_name != " " and class_number is None:
             return
 
-        image_bg_color = self.__get_image_bg_color(image_name)
-        list(self.gallery_frame.children.values())[self.selected_index + len(self.nested_folders)].configure({"background" : image_bg_color})
-        self.save_labels()
+        operations = []
+        for index in indices:
+            image_name = os.path.relpath(self.image_files[index], self.initial_folder)
+            if class_number is None:
+                if self.labeled_files.pop(image_name, None) is not None:
+                    operations.append({"op": UNSET, "path": image_name})
+            else:
+                self.labeled_files[image_name] = class_number
+                operations.append({"op": SET, "path": image_name, "class": class_number})
+
+        self.gallery.refresh_tiles(indices)
+        self.__record_label_operations(operations)
+
+
+    def __record_label_operations(self, operations : list):
+        if self.label_store is None:
+            return
+        try:
+            self.label_store.apply(operations)
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Ошибка при записи в файл: {e}")
+            return
+        if self.label_store.needs_flush():
+            self.save_labels()
 
 
     def save_labels(self):
-        if not self.folder:
+        if not self.folder or self.label_store is None:
             return
-        if not self.project: 
-            labels_path = os.path.join(self.folder, "labels.json")
-        else:
-            labels_path = self.project["labels"]
         try:
-            with open(labels_path, "w", encoding="utf-8") as file:
-                json.dump(self.labeled_files, file, ensure_ascii=False, indent=4)
-            # print(f"Labels saved successfully to {labels_path}")
+            self.label_store.flush(self.labeled_files)
+            # print(f"Labels saved successfully to {self.label_store.labels_path}")
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка при записи в файл: {e}")
             # print(f"Ошибка при записи в файл: {e}")
@@ -714,40 +957,66 @@ class ImageLabelerApp:
         
         cropper_window = tk.Toplevel(self.root)
         
-        image_path = self.image_files[self.selected_index]
+        source_index = self.selected_index
+        image_path = self.image_files[source_index]
         cropper = ImageCropper(cropper_window)
         cropper.set_file(image_path)
         cropper.set_save_copy(self.save_copy_check.get())
-        def on_cropper_close():
-            self.load_images(self.folder)
-            cropper_window.destroy()
+        def on_cropper_destroy(event):
+            if event.widget is cropper_window:
+                self.__apply_cropped_files(source_index, image_path, cropper.saved_files)
 
-        cropper_window.protocol("WM_DELETE_WINDOW", on_cropper_close)
+        cropper_window.bind("<Destroy>", on_cropper_destroy)
+        cropper_window.protocol("WM_DELETE_WINDOW", cropper_window.destroy)
 
         if not cropper.run():
             tk.messagebox.showerror("Ошибка", "Размер изображения слишком мал")
 
 
-    def export_to_txt(self):
-        if not self.folder:
-            messagebox.showwarning("Предупреждение", "Папка не выбрана")
+    def __apply_cropped_files(self, source_index : int, source_path : str, saved_files : list):
+        if source_index >= len(self.image_files) or self.image_files[source_index] != source_path:
             return
-        
-        scaler_window = tk.Toplevel(self.root)
-        x = self.root.winfo_x()
-        y = self.root.winfo_y()
-        scaler_window.geometry(f"300x200+{x+200}+{y+200}")
-        scaler_window.resizable(False, False)
 
-        folder = self.folder if self.project is None else self.project["root"]
-        labels = self.project["labels"] if self.project is not None else os.path.join(folder, "labels.json")
-        name = self.project["name"] if self.project is not None else os.path.basename(folder)
+        for path in dict.fromkeys(saved_files):
+            index = self.__find_image_index(path, source_index)
+            if index is not None:
+                self.preview_cache.invalidate([path])
+                self.gallery.reload_tile(index)
+                if index == self.selected_index:
+                    self.select_image(index)
+                continue
+            self.gallery.insert_image(source_index + 1, path)
+            if self.selected_index is not None and self.selected_index > source_index:
+                self.selected_index += 1
 
-        scaler = ImageScaler(scaler_window, "txt", folder, labels, name)
-        scaler_window.protocol("WM_DELETE_WINDOW", scaler_window.destroy)
+
+    def __find_image_index(self, path : str, near : int):
+        for index in (near, near + 1):
+            if index < len(self.image_files) and self.image_files[index] == path:
+                return index
+        try:
+            return self.image_files.index(path)
+        except ValueError:
+            return None
+
+
+    def export_to_txt(self):
+        self.__open_scaler("txt")
 
 
     def export_to_csv(self):
+        self.__open_scaler("csv")
+
+
+    def export_to_npy(self):
+        self.__open_scaler("npy")
+
+
+    def export_to_idx(self):
+        self.__open_scaler("idx")
+
+
+    def __open_scaler(self, export_format : str):
         if not self.folder:
             messagebox.showwarning("Предупреждение", "Папка не выбрана")
             return
@@ -755,14 +1024,14 @@ class ImageLabelerApp:
         scaler_window = tk.Toplevel(self.root)
         x = self.root.winfo_x()
         y = self.root.winfo_y()
-        scaler_window.geometry(f"300x200+{x+200}+{y+200}")
+        scaler_window.geometry(f"320x560+{x+200}+{y+200}")
         scaler_window.resizable(False, False)
 
         folder = self.folder if self.project is None else self.project["root"]
-        labels = self.project["labels"] if self.project is not None else os.path.join(folder, "labels.json")
+        labels = self._labels_path()
         name = self.project["name"] if self.project is not None else os.path.basename(folder)
 
-        scaler = ImageScaler(scaler_window, "csv", folder, labels, name)
+        scaler = ImageScaler(scaler_window, export_format, folder, labels, name, imagesPath=self.initial_folder)
         scaler_window.protocol("WM_DELETE_WINDOW", scaler_window.destroy)
 
     
@@ -883,10 +1152,20 @@ class ImageLabelerApp:
             labels_path = os.path.join(self.folder, "labels.json")
             config_path = os.path.join(self.folder, "config.json")
         
-        parser = LabelParser(parser_window)
+        parser = LabelParser(parser_window, store=self.label_store, on_saved=self.__on_labels_parsed)
         parser.parse_filenames(self.folder, labels_path, config_path)
 
-        # parser_window.protocol("WM_DELETE_WINDOW", self.__restart_programm)             
+
+
+    def __on_labels_parsed(self):
+        # the parser replaced labels and classes through the app's store, the table is rebuilt from it
+        if self.label_store is not None:
+            try:
+                self.labeled_files = LabelTable.from_items(self.label_store.load())
+            except Exception:
+                self.label_store.close()
+                self.label_store = None
+        self.__reload_app_state()
 
 
     def create_labels_from_folders(self):
@@ -901,5 +1180,5 @@ class ImageLabelerApp:
                 labels_path = os.path.join(self.folder, "labels.json")
                 config_path = os.path.join(self.folder, "config.json")
             
-            parser = LabelParser(None)
+            parser = LabelParser(None, store=self.label_store, on_saved=self.__on_labels_parsed)
             parser.parse_folders(self.folder, labels_path, config_path)
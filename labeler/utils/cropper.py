@@ -1,6 +1,8 @@
 from PIL import Image, ImageTk
 import tkinter as Tkinter
 
+from .image_loader import load_image
+
 
 class ImageCropper:
 
@@ -20,6 +22,7 @@ class ImageCropper:
         self.canvas_message = None
         self.save_copy = True
         self.files = []
+        self.saved_files = []
         self.box = [0, 0, 0, 0]
         self.ratio = 1.0
         self.canvas = Tkinter.Canvas(self.root, 
@@ -56,18 +59,12 @@ class ImageCropper:
             # print( 'Ignore: ' + filename + ' cannot be opened as an image')
             return False
         # ratio = float(self.img.size[1]) / self.img.size[0]
-        if self.img.size[0] > 1200:
-            self.scale = self.img.size[0] / 1200
-            self.resized_img = self.img.resize( (int(self.img.size[0] / self.scale),
-                                                   int(self.img.size[1] / self.scale)), )
-        if self.img.size[1] > 800:
-            self.scale = self.img.size[1] / 800
-            self.resized_img = self.img.resize( (int(self.img.size[0] / self.scale),
-                                                    int(self.img.size[1] / self.scale))
-                                                    )
-        if self.img.size[0] <= 1200 and self.img.size[1] <= 800:
+        self.scale = max(self.img.size[0] / 1200, self.img.size[1] / 800, 1)
+        if self.scale > 1:
+            self.resized_img, _ = load_image(filename, (int(self.img.size[0] / self.scale),
+                                                        int(self.img.size[1] / self.scale)))
+        else:
             self.resized_img = self.img
-            self.scale = 1
         self.photo = ImageTk.PhotoImage(self.resized_img)
         self.canvas.delete(self.canvas_image)
         self.canvas.config(width = self.resized_img.size[0], height = self.resized_img.size[1])
@@ -101,6 +98,7 @@ class ImageCropper:
             if cropped.size[0] == 0 and cropped.size[1] == 0:
                 raise SystemError('no size')
             cropped.save(self.outputname + '.jpg', 'jpeg')
+            self.saved_files.append(self.outputname + '.jpg')
             self.message = 'Saved: ' + self.outputname + '.jpg'
         except SystemError as e:
             print(e)
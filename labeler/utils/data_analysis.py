@@ -1,5 +1,3 @@
-import json
-from collections import Counter
 import os
 import numpy as np
 import pandas as pd
@@ -7,16 +5,16 @@ import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
+from .label_store import label_counts
+
 
 def plot_from_labels(labels_path: str):
     try:
-        with open(labels_path, 'r') as f:
-            labels = json.load(f)
+        class_counts = label_counts(labels_path)
     except Exception as e:
-        print(f"Error loading JSON file: {e}")
+        print(f"Error loading labels: {e}")
         return
 
-    class_counts = Counter(labels.values())
     classes = sorted(class_counts.keys(), key=lambda x: class_counts[x], reverse=True)
     counts = [class_counts[cls] for cls in classes]
     total_samples = sum(counts)
@@ -0,0 +1,88 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+SUPPORTED_FORMATS = (".png", ".jpg", ".jpeg", ".bmp", ".gif")
+
+
+class DirectoryEntry:
+    __slots__ = ("name", "path", "is_dir", "size", "mtime")
+
+    def __init__(self, name : str, path : str, is_dir : bool, size : int, mtime : int):
+        self.name = name
+        self.path = path
+        self.is_dir = is_dir
+        self.size = size
+        self.mtime = mtime
+
+
+class DirectoryIndex:
+    # budget counts cached entries across all folders, the least recently listed folders go first
+    def __init__(self, budget : int = 500000):
+        self.budget = budget
+        self.listings = OrderedDict()
+        self.size = 0
+        self._lock = threading.Lock()
+
+
+    def entries(self, folder : str) -> list:
+        mtime = os.stat(folder).st_mtime_ns
+        with self._lock:
+            cached = self.listings.get(folder)
+            if cached is not None and cached[0] == mtime:
+                self.listings.move_to_end(folder)
+                return cached[1]
+
+        entries = []
+        with os.scandir(folder) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append(DirectoryEntry(entry.name, os.path.join(folder, entry.name), is_dir, stat.st_size, stat.st_mtime_ns))
+
+        with self._lock:
+            self._discard(folder)
+            if len(entries) <= self.budget:
+                self.listings[folder] = (mtime, entries)
+                self.size += len(entries)
+            while self.size > self.budget:
+                _, (_, evicted) = self.listings.popitem(last=False)
+                self.size -= len(evicted)
+        return entries
+
+
+    def _discard(self, folder : str):
+        cached = self.listings.pop(folder, None)
+        if cached is not None:
+            self.size -= len(cached[1])
+
+
+    def mtime(self, folder : str):
+        with self._lock:
+            cached = self.listings.get(folder)
+        return cached[0] if cached is not None else None
+
+
+    def folders(self, folder : str) -> list:
+        return [entry.path for entry in self.entries(folder) if entry.is_dir]
+
+
+    def images(self, folder : str) -> list:
+        return [entry.path for entry in self.entries(folder)
+                if not entry.is_dir and entry.name.lower().endswith(SUPPORTED_FORMATS)]
+
+
+    def invalidate(self, folder : str = None):
+        with self._lock:
+            if folder is None:
+                self.listings.clear()
+                self.size = 0
+            else:
+                self._discard(folder)
+
+
+directory_index = DirectoryIndex()
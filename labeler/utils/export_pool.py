@@ -0,0 +1,168 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+from PIL import Image
+
+
+# colour mode -> channels per pixel
+COLOR_MODES = {"gray": 1, "rgb": 3, "rgba": 4}
+# (decoded channels, mode) -> conversion, the decoded image is BGR or BGRA
+COLOR_CONVERSIONS = {
+    (3, "gray"): cv2.COLOR_BGR2GRAY, (3, "rgb"): cv2.COLOR_BGR2RGB,
+    (4, "gray"): cv2.COLOR_BGRA2GRAY, (4, "rgb"): cv2.COLOR_BGRA2RGB, (4, "rgba"): cv2.COLOR_BGRA2RGBA,
+}
+TO_BGRA = {2: cv2.COLOR_GRAY2BGRA, 3: cv2.COLOR_BGR2BGRA}
+
+ALPHA_MODES = {"RGBA", "LA", "PA", "RGBa", "La"}
+EXIF_ORIENTATION = 0x0112
+# EXIF orientation -> transform that turns the stored pixels upright
+ORIENTATIONS = {
+    2: lambda image: cv2.flip(image, 1),
+    3: lambda image: cv2.rotate(image, cv2.ROTATE_180),
+    4: lambda image: cv2.flip(image, 0),
+    5: lambda image: cv2.transpose(image),
+    6: lambda image: cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE),
+    7: lambda image: cv2.flip(cv2.transpose(image), -1),
+    8: lambda image: cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE),
+}
+
+# reduction -> how many times larger than the target the reduced decode must stay
+REDUCTIONS = {"quality": 2, "fast": 1}
+REDUCED_FLAGS = {
+    (True, 1): cv2.IMREAD_GRAYSCALE, (True, 2): cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    (True, 4): cv2.IMREAD_REDUCED_GRAYSCALE_4, (True, 8): cv2.IMREAD_REDUCED_GRAYSCALE_8,
+    (False, 1): cv2.IMREAD_COLOR, (False, 2): cv2.IMREAD_REDUCED_COLOR_2,
+    (False, 4): cv2.IMREAD_REDUCED_COLOR_4, (False, 8): cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def reduction_factor(size : tuple, targets : tuple, reduction : str) -> int:
+    # the short side must still cover the largest target side, whichever way EXIF turns the image
+    needed = max(max(resolution) for resolution, _ in targets) * REDUCTIONS[reduction]
+    for factor in (8, 4, 2):
+        if min(size) // factor >= needed:
+            return factor
+    return 1
+
+
+def read_bgra(image_path : str, orientation : int = 1):
+    # IMREAD_UNCHANGED keeps alpha but skips the EXIF rotation the other imread flags apply
+    image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+    if image is None:
+        return None
+    if orientation in ORIENTATIONS:
+        image = ORIENTATIONS[orientation](image)
+    if image.dtype == np.uint16:
+        image = (image >> 8).astype(np.uint8)
+    elif image.dtype != np.uint8:
+        image = cv2.normalize(image, None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
+    channels = 2 if image.ndim == 2 else image.shape[2]
+    return image if channels == 4 else cv2.cvtColor(image, TO_BGRA[channels])
+
+
+def decode_with_stats(image_path : str, targets : tuple, reduction : str = ""):
+    # returns (one image per target or None, full-size pixels, decoded pixels)
+    factor = 1
+    full_pixels = None
+    alpha = False
+    orientation = 1
+    modes = {mode for _, mode in targets}
+    if reduction or "rgba" in modes:
+        try:
+            # only the header is read here, libjpeg can skip DCT work only for JPEG files
+            with Image.open(image_path) as header:
+                full_pixels = header.size[0] * header.size[1]
+                if reduction and header.format == "JPEG":
+                    factor = reduction_factor(header.size, targets, reduction)
+                if "rgba" in modes:
+                    alpha = header.mode in ALPHA_MODES or "transparency" in header.info
+                    orientation = header.getexif().get(EXIF_ORIENTATION, 1) if alpha else 1
+        except Exception:
+            pass
+
+    if modes == {"gray"}:
+        image = cv2.imread(image_path, REDUCED_FLAGS[True, factor])
+    elif alpha:
+        # the reduced flags drop alpha, so files that have one are always decoded at full size
+        image = read_bgra(image_path, orientation)
+    else:
+        image = cv2.imread(image_path, REDUCED_FLAGS[False, factor])
+        if image is not None and "rgba" in modes:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
+    if image is None:
+        return None, 0, 0
+    decoded_pixels = image.shape[0] * image.shape[1]
+    if image.ndim == 2:
+        converted = {"gray": image}
+    else:
+        converted = {mode: cv2.cvtColor(image, COLOR_CONVERSIONS[image.shape[2], mode]) for mode in modes}
+    return [cv2.resize(converted[mode], resolution) for resolution, mode in targets], full_pixels or decoded_pixels, decoded_pixels
+
+
+def decode_targets(image_path : str, targets : tuple, reduction : str = ""):
+    # targets are ((width, height), mode) pairs, the file is read once and resized to each of them
+    return decode_with_stats(image_path, targets, reduction)[0]
+
+
+def decode_image(image_path : str, resolution : tuple, mode : str = "gray", reduction : str = ""):
+    images = decode_targets(image_path, ((resolution, mode),), reduction)
+    return None if images is None else images[0]
+
+
+def decode_chunk(image_paths : list, targets : tuple, reduction : str = "") -> list:
+    return [decode_with_stats(image_path, targets, reduction) for image_path in image_paths]
+
+
+def default_workers() -> int:
+    return max(1, (os.cpu_count() or 1) - 1)
+
+
+class ExportPool:
+    def __init__(self, workers : int = None, chunk_size : int = 64, prefetch : int = 2):
+        self.workers = default_workers() if workers is None else max(0, workers)
+        self.chunk_size = max(1, chunk_size)
+        self.prefetch = max(1, prefetch)
+        self.full_pixels = 0
+        self.decoded_pixels = 0
+
+
+    def _count(self, image_path : str, result : tuple):
+        images, full_pixels, decoded_pixels = result
+        self.full_pixels += full_pixels
+        self.decoded_pixels += decoded_pixels
+        return image_path, images
+
+
+    def map(self, image_paths : list, targets : tuple, reduction : str = ""):
+        # yields (path, one uint8 array per target or None) in input order, whatever order the chunks finish in
+        self.full_pixels = 0
+        self.decoded_pixels = 0
+        return self._map(image_paths, tuple(targets), reduction)
+
+
+    def _map(self, image_paths : list, targets : tuple, reduction : str):
+        if self.workers <= 1 or len(image_paths) <= self.chunk_size:
+            for image_path in image_paths:
+                yield self._count(image_path, decode_with_stats(image_path, targets, reduction))
+            return
+
+        chunks = [image_paths[i:i + self.chunk_size] for i in range(0, len(image_paths), self.chunk_size)]
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            next_chunk = 0
+            # a bounded window of chunks in flight keeps memory flat when the writer is slower than the decoders
+            while next_chunk < len(chunks) and len(pending) < self.workers * self.prefetch:
+                pending.append((chunks[next_chunk], executor.submit(decode_chunk, chunks[next_chunk], targets, reduction)))
+                next_chunk += 1
+
+            while pending:
+                chunk, future = pending.popleft()
+                results = future.result()
+                if next_chunk < len(chunks):
+                    pending.append((chunks[next_chunk], executor.submit(decode_chunk, chunks[next_chunk], targets, reduction)))
+                    next_chunk += 1
+                for image_path, result in zip(chunk, results):
+                    yield self._count(image_path, result)
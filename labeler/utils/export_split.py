@@ -0,0 +1,62 @@
+import numpy as np
+
+
+SPLITS = ("train", "val", "test")
+UNDERSAMPLE = "under"
+OVERSAMPLE = "over"
+
+
+def parse_ratios(text : str):
+    # "80/10/10" or "0.8, 0.2" -> normalized (train, val, test), an empty string means no split
+    parts = [part for part in text.replace(",", "/").replace(" ", "/").split("/") if part]
+    if not parts:
+        return None
+    ratios = [float(part) for part in parts]
+    if len(ratios) > len(SPLITS) or any(ratio < 0 for ratio in ratios) or sum(ratios) <= 0:
+        raise ValueError(f"Invalid split ratios: {text}")
+    ratios += [0.0] * (len(SPLITS) - len(ratios))
+    return tuple(ratio / sum(ratios) for ratio in ratios)
+
+
+def split_counts(count : int, ratios) -> np.ndarray:
+    # largest remainder rounding, so the parts always add up to count
+    exact = np.asarray(ratios, dtype=np.float64) * count
+    counts = np.floor(exact).astype(np.int64)
+    rest = count - int(counts.sum())
+    counts[np.argsort(-(exact - counts), kind="stable")[:rest]] += 1
+    return counts
+
+
+def split_plan(labels : list, ratios=None, seed : int = 0, balance : str = ""):
+    # returns (input index, split index) per output row, in input order, copies of one input stay adjacent
+    count = len(labels)
+    if ratios is None:
+        return np.arange(count), np.zeros(count, dtype=np.int8)
+
+    _, classes = np.unique(np.array([str(label) for label in labels]), return_inverse=True)
+    rng = np.random.default_rng(seed)
+    splits = np.zeros(count, dtype=np.int8)
+    for class_id in range(int(classes.max()) + 1 if count else 0):
+        members = rng.permutation(np.flatnonzero(classes == class_id))
+        parts = np.split(members, np.cumsum(split_counts(len(members), ratios))[:-1])
+        for split, part in enumerate(parts):
+            splits[part] = split
+
+    # balancing only touches the training split, validation and test keep the real class distribution
+    copies = np.ones(count, dtype=np.int64)
+    if balance:
+        train = splits == 0
+        per_class = np.bincount(classes[train], minlength=int(classes.max()) + 1 if count else 0)
+        present = per_class[per_class > 0]
+        if present.size:
+            target = int(present.min() if balance == UNDERSAMPLE else present.max())
+            for class_id in np.flatnonzero(per_class):
+                members = np.flatnonzero(train & (classes == class_id))
+                if balance == UNDERSAMPLE:
+                    copies[rng.choice(members, len(members) - target, replace=False)] = 0
+                else:
+                    copies[members] = target // len(members)
+                    copies[rng.choice(members, target % len(members), replace=False)] += 1
+
+    indices = np.repeat(np.arange(count), copies)
+    return indices, splits[indices]
@@ -0,0 +1,261 @@
+import os
+import bz2
+import gzip
+import json
+import lzma
+from collections import Counter
+
+import numpy as np
+
+from .label_journal import write_json_atomic
+
+
+# every uint8 pixel has one of 256 text forms, so rows are formatted by table lookup
+FLOAT_VALUES = np.array([str(np.around(value / 255.0, decimals=3)) for value in range(256)], dtype=object)
+INTEGER_VALUES = np.array([str(value) for value in range(256)], dtype=object)
+
+COMPRESSORS = {"gz": gzip.open, "bz2": bz2.open, "xz": lzma.open}
+
+
+def open_output(path : str, mode : str = "w", compression : str = "", buffer_size : int = 1 << 20):
+    if not compression:
+        return open(path, mode, buffering=buffer_size)
+    return COMPRESSORS[compression](path, mode + "t")
+
+
+def output_extension(extension : str, compression : str = "") -> str:
+    return f"{extension}.{compression}" if compression else extension
+
+
+class ExportWriter:
+    def __init__(self, path : str, compact : bool = False, mode : str = "w", block_size : int = 256, buffer_size : int = 1 << 20, compression : str = ""):
+        self.path = path
+        self.values = INTEGER_VALUES if compact else FLOAT_VALUES
+        self.block_size = block_size
+        self.empty = mode == "w" or not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open_output(path, mode, compression, buffer_size)
+        self.images = []
+        self.labels = []
+        self.rows = 0
+
+
+    def advance(self):
+        pass
+
+
+    def write(self, image, label):
+        self.images.append(image)
+        self.labels.append(label)
+        if len(self.images) >= self.block_size:
+            self.flush()
+
+
+    def flush(self):
+        if not self.images:
+            return
+        block = self.values[np.stack(self.images).reshape(len(self.images), -1)]
+        self.file.write(self._format(block, self.labels))
+        self.rows += len(self.images)
+        self.images = []
+        self.labels = []
+
+
+    def _format(self, block, labels) -> str:
+        raise NotImplementedError
+
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.file.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TxtWriter(ExportWriter):
+    def __init__(self, path : str, classes : list, **kwargs):
+        super().__init__(path, **kwargs)
+        self.one_hot = {str(label): " ".join("1" if str(other) == str(label) else "0" for other in classes) for label in classes}
+
+
+    def _format(self, block, labels) -> str:
+        return "".join(" ".join(row) + "\n" + self.one_hot[str(label)] + "\n" for row, label in zip(block, labels))
+
+
+class CsvWriter(ExportWriter):
+    def __init__(self, path : str, header : str = None, **kwargs):
+        super().__init__(path, **kwargs)
+        if header is not None and self.empty:
+            self.file.write(header + "\n")
+
+
+    def _format(self, block, labels) -> str:
+        return "".join(f"{label}," + ",".join(row) + "\n" for row, label in zip(block, labels))
+
+
+class ShardedWriter:
+    MANIFEST_NAME = "manifest.json"
+    SHARD_PREFIX = "shard_"
+
+    def __init__(self, directory : str, extension : str, open_shard, shard_rows : int, settings : dict):
+        self.directory = directory
+        self.extension = extension
+        self.open_shard = open_shard
+        self.shard_rows = max(1, shard_rows)
+        self.manifest_path = os.path.join(directory, self.MANIFEST_NAME)
+        os.makedirs(directory, exist_ok=True)
+        self.manifest = self._resume(json.loads(json.dumps(settings)))
+
+        self.writer = None
+        self.temp_path = None
+        self.rows = 0
+        self.inputs = 0
+        self.histogram = Counter()
+
+
+    def _resume(self, settings : dict) -> dict:
+        manifest = None
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        # only an interrupted export is resumed, a finished one may describe images that changed since
+        if manifest is None or manifest.get("complete") or manifest.get("settings") != settings:
+            manifest = {"settings": settings, "complete": False, "rows": 0, "classes": {}, "shards": []}
+
+        # shard files missing from the manifest were interrupted mid-write or belong to an older export
+        listed = {shard["file"] for shard in manifest["shards"]}
+        for name in os.listdir(self.directory):
+            if name.startswith(self.SHARD_PREFIX) and name not in listed:
+                os.remove(os.path.join(self.directory, name))
+        return manifest
+
+
+    @property
+    def skip(self) -> int:
+        # inputs already covered by finished shards, including the ones that failed to decode
+        return sum(shard["inputs"] for shard in self.manifest["shards"])
+
+
+    def _shard_name(self) -> str:
+        return f"{self.SHARD_PREFIX}{len(self.manifest['shards']):05d}.{self.extension}"
+
+
+    def advance(self):
+        self.inputs += 1
+
+
+    def write(self, image, label):
+        if self.writer is None:
+            self.temp_path = os.path.join(self.directory, self._shard_name() + ".tmp")
+            self.writer = self.open_shard(self.temp_path)
+        self.writer.write(image, label)
+        self.rows += 1
+        self.histogram[str(label)] += 1
+        if self.rows >= self.shard_rows:
+            self._finish_shard()
+
+
+    def _finish_shard(self):
+        name = self._shard_name()
+        self.writer.close()
+        os.replace(self.temp_path, os.path.join(self.directory, name))
+
+        self.manifest["shards"].append({"file": name, "rows": self.rows, "inputs": self.inputs, "classes": dict(self.histogram)})
+        self.manifest["rows"] += self.rows
+        self.manifest["classes"] = dict(Counter(self.manifest["classes"]) + self.histogram)
+        write_json_atomic(self.manifest_path, self.manifest)
+
+        self.writer = None
+        self.rows = 0
+        self.inputs = 0
+        self.histogram = Counter()
+
+
+    def close(self):
+        if self.writer is not None:
+            self._finish_shard()
+        self.manifest["complete"] = True
+        write_json_atomic(self.manifest_path, self.manifest)
+
+
+    def abort(self):
+        # finished shards stay listed in the manifest, so the next run resumes after them
+        if self.writer is not None:
+            self.writer.close()
+            os.remove(self.temp_path)
+            self.writer = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def label_dtype(labels) -> np.dtype:
+    labels = np.asarray(labels)
+    if labels.size and (labels.min() < 0 or labels.max() > 255):
+        return np.dtype(np.int16)
+    return np.dtype(np.uint8)
+
+
+def shrink_npy(path : str, rows : int):
+    # rewrites the shape in the existing header, padded to its old length, and drops the unused tail
+    with open(path, "r+b") as f:
+        version = np.lib.format.read_magic(f)
+        if version != (1, 0):
+            raise ValueError(f"Unsupported .npy version {version}")
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        offset = f.tell()
+        header = repr({"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": fortran_order, "shape": (rows,) + tuple(shape[1:])})
+        f.seek(10)
+        f.write((header.ljust(offset - 11) + "\n").encode("latin1"))
+        f.truncate(offset + rows * int(np.prod(shape[1:], dtype=np.int64)) * dtype.itemsize)
+
+
+class NpyWriter:
+    def __init__(self, images_path : str, labels_path : str, count : int, shape : tuple):
+        self.images_path = images_path
+        self.labels_path = labels_path
+        self.images = np.lib.format.open_memmap(images_path, mode="w+", dtype=np.uint8, shape=(count,) + tuple(shape))
+        self.labels = []
+        self.rows = 0
+
+
+    def advance(self):
+        pass
+
+
+    def write(self, image, label):
+        self.images[self.rows] = image
+        self.labels.append(int(label))
+        self.rows += 1
+
+
+    def close(self):
+        count = len(self.images)
+        self.images.flush()
+        self.images = None
+        if self.rows < count:
+            shrink_npy(self.images_path, self.rows)
+        np.save(self.labels_path, np.asarray(self.labels, dtype=label_dtype(self.labels)))
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
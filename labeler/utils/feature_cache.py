@@ -0,0 +1,131 @@
+import os
+import time
+import sqlite3
+import numpy as np
+
+
+class FeatureCache:
+    def __init__(self, db_path : str, budget : int = 1024 * 1024 * 1024, commit_every : int = 256, batch_size : int = 500):
+        self.db_path = db_path
+        self.budget = budget
+        self.commit_every = commit_every
+        self.batch_size = batch_size
+        self._pending = 0
+
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS features ("
+            "path TEXT NOT NULL, "
+            "width INTEGER NOT NULL, "
+            "height INTEGER NOT NULL, "
+            "mode TEXT NOT NULL, "
+            "mtime INTEGER NOT NULL, "
+            "file_size INTEGER NOT NULL, "
+            "last_used REAL NOT NULL, "
+            "data BLOB NOT NULL, "
+            "PRIMARY KEY (path, width, height, mode))"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS features_last_used ON features (last_used)")
+        self.connection.commit()
+        self.nbytes = self.connection.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM features").fetchone()[0]
+
+
+    @staticmethod
+    def _key(path : str) -> str:
+        return os.path.normcase(os.path.abspath(path))
+
+
+    @staticmethod
+    def _stat(path : str):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+
+    def fresh(self, paths : list, resolution : tuple, mode : str) -> set:
+        # only compares signatures, the blobs are read one by one while writing
+        width, height = resolution
+        now = time.time()
+        fresh = set()
+        for start in range(0, len(paths), self.batch_size):
+            batch = {self._key(path): path for path in paths[start:start + self.batch_size]}
+            rows = self.connection.execute(
+                "SELECT path, mtime, file_size FROM features WHERE width = ? AND height = ? AND mode = ? "
+                f"AND path IN ({','.join('?' * len(batch))})",
+                (width, height, mode, *batch)
+            ).fetchall()
+            used = []
+            for key, mtime, file_size in rows:
+                if self._stat(batch[key]) == (mtime, file_size):
+                    fresh.add(batch[key])
+                    used.append((now, key, width, height, mode))
+            self.connection.executemany(
+                "UPDATE features SET last_used = ? WHERE path = ? AND width = ? AND height = ? AND mode = ?", used
+            )
+        self.connection.commit()
+        return fresh
+
+
+    def get(self, path : str, resolution : tuple, mode : str):
+        width, height = resolution
+        row = self.connection.execute(
+            "SELECT data FROM features WHERE path = ? AND width = ? AND height = ? AND mode = ?",
+            (self._key(path), width, height, mode)
+        ).fetchone()
+        if row is None:
+            return None
+        image = np.frombuffer(row[0], dtype=np.uint8)
+        channels = image.size // (width * height)
+        return image.reshape((height, width) if channels == 1 else (height, width, channels))
+
+
+    def put(self, path : str, resolution : tuple, mode : str, image : np.ndarray):
+        signature = self._stat(path)
+        if signature is None:
+            return
+        width, height = resolution
+        data = np.ascontiguousarray(image, dtype=np.uint8).tobytes()
+        key = (self._key(path), width, height, mode)
+        previous = self.connection.execute(
+            "SELECT LENGTH(data) FROM features WHERE path = ? AND width = ? AND height = ? AND mode = ?", key
+        ).fetchone()
+        self.connection.execute(
+            "INSERT OR REPLACE INTO features (path, width, height, mode, mtime, file_size, last_used, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (*key, *signature, time.time(), data)
+        )
+        self.nbytes += len(data) - (previous[0] if previous else 0)
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.flush()
+
+
+    def evict(self):
+        # least recently used rows go first until the cache fits its budget again
+        while self.nbytes > self.budget:
+            rows = self.connection.execute(
+                "SELECT rowid, LENGTH(data) FROM features ORDER BY last_used LIMIT ?", (self.batch_size,)
+            ).fetchall()
+            if not rows:
+                self.nbytes = 0
+                break
+            for rowid, size in rows:
+                if self.nbytes <= self.budget:
+                    break
+                self.connection.execute("DELETE FROM features WHERE rowid = ?", (rowid,))
+                self.nbytes -= size
+        self.flush()
+
+
+    def flush(self):
+        self.connection.commit()
+        self._pending = 0
+
+
+    def close(self):
+        self.evict()
+        self.connection.close()
@@ -0,0 +1,67 @@
+import os
+import sys
+from collections import OrderedDict
+
+
+def directory_mtime(folder : str):
+    try:
+        return os.stat(folder).st_mtime_ns
+    except OSError:
+        return None
+
+
+class FolderState:
+    def __init__(self, mtime, nested_folders : list, image_files : list, thumbnails=None, scroll : float = 0.0):
+        self.mtime = mtime
+        self.nested_folders = list(nested_folders)
+        self.image_files = list(image_files)
+        self.thumbnails = OrderedDict(thumbnails or {})
+        self.scroll = scroll
+        self.nbytes = self._estimate_size()
+
+
+    def _estimate_size(self) -> int:
+        size = sum(sys.getsizeof(path) for path in self.image_files)
+        size += sum(sys.getsizeof(path) for path in self.nested_folders)
+        for image in self.thumbnails.values():
+            size += image.size[0] * image.size[1] * len(image.getbands())
+        return size
+
+
+class FolderStateCache:
+    def __init__(self, budget : int = 256 * 1024 * 1024):
+        self.budget = budget
+        self.states = OrderedDict()
+        self.nbytes = 0
+
+
+    def get(self, folder : str):
+        state = self.states.get(folder)
+        if state is None:
+            return None
+        if state.mtime is None or state.mtime != directory_mtime(folder):
+            self.invalidate(folder)
+            return None
+        self.states.move_to_end(folder)
+        return state
+
+
+    def put(self, folder : str, state : FolderState):
+        self.invalidate(folder)
+        if state.nbytes > self.budget:
+            return
+        self.states[folder] = state
+        self.nbytes += state.nbytes
+        while self.nbytes > self.budget:
+            _, evicted = self.states.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+
+
+    def invalidate(self, folder : str = None):
+        if folder is None:
+            self.states.clear()
+            self.nbytes = 0
+            return
+        state = self.states.pop(folder, None)
+        if state is not None:
+            self.nbytes -= state.nbytes
@@ -0,0 +1,598 @@
+import os
+from collections import OrderedDict
+from PIL import Image, ImageTk
+
+from .thumbnail_loader import ThumbnailLoader
+
+
+class VirtualGallery:
+    def __init__(self, canvas, width : int, load_thumbnail, on_image_click, on_folder_click, get_color,
+                 on_idle=None, on_selection_change=None, background="#e7edf9", overscan_rows : int = 2,
+                 border : int = 3, atlas : bool = False, selection_color="#1E90FF", drag_threshold : int = 4):
+        self.canvas = canvas
+        self.width = width
+        self.on_image_click = on_image_click
+        self.on_folder_click = on_folder_click
+        self.on_selection_change = on_selection_change
+        self.get_color = get_color
+        self.selection_color = selection_color
+        self.drag_threshold = drag_threshold
+        self.background = background
+        self.overscan_rows = overscan_rows
+        self.border = border
+        self.atlas = atlas
+
+        self.loader = ThumbnailLoader(canvas, load_thumbnail, self._on_thumbnail_loaded, on_idle=on_idle)
+
+        self.folders = []
+        self.image_files = []
+        self.folder_image = None
+        self.folder_photo = None
+        self.tile_size = 85
+        self.per_row = 1
+        self.pad_x = 5
+        self.pad_y = 5
+
+        self.slots = []
+        self.free_slots = []
+        self.visible = {}
+        self.visible_paths = {}
+        self.visible_range = range(0)
+        self.thumbnails = OrderedDict()
+        self.photos = {}
+        self.requested = set()
+
+        self.pages = {}
+        self.free_pages = []
+        self.dirty_pages = set()
+        self._flush_job = None
+
+        self.selection = set()
+        self.anchor = None
+        self.press = None
+        self.band = None
+
+        self.canvas.bind("<Button-1>", self._on_press)
+        self.canvas.bind("<Shift-Button-1>", lambda e: self._on_press(e, "range"))
+        self.canvas.bind("<Control-Button-1>", lambda e: self._on_press(e, "toggle"))
+        self.canvas.bind("<B1-Motion>", self._on_drag)
+        self.canvas.bind("<ButtonRelease-1>", self._on_release)
+        self.canvas.bind("<Configure>", lambda e: self.update_visible())
+
+
+    def attach_scrollbar(self, scrollbar):
+        def on_yscroll(first, last):
+            scrollbar.set(first, last)
+            self.update_visible()
+
+        self.canvas.configure(yscrollcommand=on_yscroll)
+
+
+    @property
+    def cell_width(self) -> int:
+        return self.tile_size + 2 * (self.border + self.pad_x)
+
+
+    @property
+    def cell_height(self) -> int:
+        return self.tile_size + 2 * (self.border + self.pad_y)
+
+
+    @property
+    def page_rows(self) -> int:
+        return max(1, -(-self._viewport_height() // self.cell_height))
+
+
+    def count(self) -> int:
+        return len(self.folders) + len(self.image_files)
+
+
+    def rows(self) -> int:
+        return -(-self.count() // self.per_row)
+
+
+    def set_items(self, folders : list, image_files : list, tile_size : int, per_row : int, pad_x : int, pad_y : int,
+                  folder_image=None, thumbnails=None, scroll : float = 0.0):
+        self.clear()
+        if thumbnails:
+            self.thumbnails = OrderedDict(thumbnails)
+
+        self.folders = folders
+        self.image_files = image_files
+        self.tile_size = tile_size
+        self.per_row = max(1, per_row)
+        self.pad_x = pad_x
+        self.pad_y = pad_y
+
+        self.folder_image = None
+        self.folder_photo = None
+        if folder_image is not None:
+            if folder_image.size != (tile_size, tile_size):
+                folder_image = folder_image.resize((tile_size, tile_size))
+            self.folder_image = folder_image
+            self.folder_photo = ImageTk.PhotoImage(folder_image)
+
+        self.canvas.configure(scrollregion=(0, 0, self.per_row * self.cell_width, self.rows() * self.cell_height))
+        self.canvas.yview_moveto(scroll)
+        self.update_visible()
+
+
+    def snapshot(self):
+        return OrderedDict(self.thumbnails), self.canvas.yview()[0]
+
+
+    def set_atlas(self, atlas : bool):
+        if atlas == self.atlas:
+            return
+        self._release_visible()
+        self.atlas = atlas
+        self.update_visible()
+
+
+    def _release_visible(self):
+        for slot in self.visible.values():
+            self._hide_slot(slot)
+            self.free_slots.append(slot)
+        self.visible = {}
+        self.visible_paths = {}
+        self.visible_range = range(0)
+        self.photos = {}
+
+        for page in self.pages.values():
+            self.canvas.itemconfigure(page["item"], state="hidden")
+            self.free_pages.append(page)
+        self.pages = {}
+        self.dirty_pages = set()
+
+
+    def clear(self):
+        self.loader.cancel()
+        self._release_visible()
+        self.thumbnails = OrderedDict()
+        self.requested = set()
+        self.selection = set()
+        self.anchor = None
+        self.folders = []
+        self.image_files = []
+        self.canvas.configure(scrollregion=(0, 0, 0, 0))
+
+
+    def close(self):
+        if self._flush_job is not None:
+            self.canvas.after_cancel(self._flush_job)
+            self._flush_job = None
+        self.loader.close()
+
+
+    def _viewport_height(self) -> int:
+        return max(self.canvas.winfo_height(), int(self.canvas.cget("height")))
+
+
+    def _viewport_rows(self):
+        top = self.canvas.canvasy(0)
+        first_row = int(top // self.cell_height)
+        last_row = int((top + self._viewport_height()) // self.cell_height)
+        return first_row, last_row
+
+
+    def update_visible(self):
+        total = self.count()
+        if total == 0:
+            return
+
+        first_row, last_row = self._viewport_rows()
+        first_row = max(0, first_row - self.overscan_rows)
+        last_row = min(self.rows() - 1, last_row + self.overscan_rows)
+        positions = range(first_row * self.per_row, min(total, (last_row + 1) * self.per_row))
+        if positions == self.visible_range:
+            return
+
+        for position in list(self.visible):
+            if position not in positions:
+                slot = self.visible.pop(position)
+                self._hide_slot(slot)
+                self.free_slots.append(slot)
+                if position >= len(self.folders):
+                    path = self.image_files[position - len(self.folders)]
+                    self.visible_paths.pop(path, None)
+                    self.photos.pop(path, None)
+
+        if self.atlas:
+            self._update_pages(first_row, last_row)
+
+        for position in positions:
+            if position not in self.visible:
+                slot = self.free_slots.pop() if self.free_slots else self._create_slot()
+                self.visible[position] = slot
+                if position >= len(self.folders):
+                    self.visible_paths[self.image_files[position - len(self.folders)]] = position
+                self._draw_slot(position, slot)
+
+        self.visible_range = positions
+        self._request_thumbnails()
+
+
+    def _create_slot(self):
+        slot = {
+            "rect": self.canvas.create_rectangle(0, 0, 0, 0, width=0, state="hidden"),
+            "image": self.canvas.create_image(0, 0, anchor="nw", state="hidden"),
+            "text": self.canvas.create_text(0, 0, state="hidden", font=("Arial", 12, "bold"), fill=self.background),
+            "mark": self.canvas.create_rectangle(0, 0, 0, 0, width=2, outline=self.selection_color, state="hidden"),
+        }
+        self.slots.append(slot)
+        return slot
+
+
+    def _hide_slot(self, slot):
+        for item in slot.values():
+            self.canvas.itemconfigure(item, state="hidden")
+
+
+    def tile_origin(self, position : int):
+        row, column = divmod(position, self.per_row)
+        return column * self.cell_width + self.pad_x, row * self.cell_height + self.pad_y
+
+
+    def _draw_slot(self, position : int, slot):
+        x, y = self.tile_origin(position)
+        outer = self.tile_size + 2 * self.border
+        self.canvas.coords(slot["text"], x + outer // 2, y + outer // 2)
+
+        if self.atlas:
+            inset = self.border / 2
+            self.canvas.coords(slot["rect"], x + inset, y + inset, x + outer - inset, y + outer - inset)
+            self.canvas.itemconfigure(slot["image"], state="hidden")
+        else:
+            self.canvas.coords(slot["rect"], x, y, x + outer, y + outer)
+            self.canvas.coords(slot["image"], x + self.border, y + self.border)
+
+        self.canvas.coords(slot["mark"], x - 1, y - 1, x + outer + 1, y + outer + 1)
+
+        if position < len(self.folders):
+            self._color_slot(slot, self.background)
+            self.canvas.itemconfigure(slot["mark"], state="hidden")
+            if not self.atlas:
+                self.canvas.itemconfigure(slot["image"], image=self.folder_photo or "", state="normal")
+            self.canvas.itemconfigure(slot["text"], text=os.path.basename(self.folders[position]), state="normal")
+            return
+
+        index = position - len(self.folders)
+        path = self.image_files[index]
+        if path in self.thumbnails:
+            self.thumbnails.move_to_end(path)
+        self._color_slot(slot, self.get_color(index))
+        self.canvas.itemconfigure(slot["text"], state="hidden")
+        if not self.atlas:
+            self.canvas.itemconfigure(slot["image"], image=self._tile_photo(path) or "", state="normal")
+        self.canvas.itemconfigure(slot["mark"], state="normal" if path in self.selection else "hidden")
+        self.canvas.tag_raise(slot["mark"])
+
+
+    def _color_slot(self, slot, color : str):
+        if self.atlas:
+            self.canvas.itemconfigure(slot["rect"], fill="", outline=color, width=self.border, state="normal")
+        else:
+            self.canvas.itemconfigure(slot["rect"], fill=color, width=0, state="normal")
+
+
+    def _tile_photo(self, path : str):
+        photo = self.photos.get(path)
+        if photo is None and path in self.thumbnails:
+            photo = ImageTk.PhotoImage(self.thumbnails[path])
+            self.photos[path] = photo
+        return photo
+
+
+    def refresh(self):
+        for position, slot in self.visible.items():
+            self._draw_slot(position, slot)
+
+
+    def refresh_tile(self, index : int):
+        slot = self.visible.get(index + len(self.folders))
+        if slot is not None:
+            self._color_slot(slot, self.get_color(index))
+
+
+    def refresh_tiles(self, indices):
+        # only tiles that have a slot are on screen, the rest get their colour when scrolled in
+        offset = len(self.folders)
+        for index in indices:
+            slot = self.visible.get(index + offset)
+            if slot is not None:
+                self._color_slot(slot, self.get_color(index))
+
+
+    def visible_indices(self) -> list:
+        offset = len(self.folders)
+        return [position - offset for position in self.visible if position >= offset]
+
+
+    def selected_indices(self) -> list:
+        if not self.selection:
+            return []
+        return [index for index, path in enumerate(self.image_files) if path in self.selection]
+
+
+    def set_selection(self, paths, anchor=None):
+        self.selection = set(paths)
+        self.anchor = anchor
+        self._update_marks()
+        if self.on_selection_change is not None:
+            self.on_selection_change()
+
+
+    def select_all(self):
+        self.set_selection(self.image_files, 0 if self.image_files else None)
+
+
+    def clear_selection(self):
+        self.set_selection(())
+
+
+    def _update_marks(self):
+        offset = len(self.folders)
+        for position, slot in self.visible.items():
+            if position >= offset:
+                selected = self.image_files[position - offset] in self.selection
+                self.canvas.itemconfigure(slot["mark"], state="normal" if selected else "hidden")
+
+
+    def reload_tile(self, index : int):
+        path = self.image_files[index]
+        self.thumbnails.pop(path, None)
+        self.photos.pop(path, None)
+        self.loader.cancel([path])
+        self.requested.discard(path)
+
+        position = index + len(self.folders)
+        slot = self.visible.get(position)
+        if slot is None:
+            return
+        if self.atlas:
+            number = self._paste_tile(position, self.background)
+            if number is not None:
+                self._mark_dirty(number)
+        self._draw_slot(position, slot)
+        self._request_thumbnails()
+
+
+    def apply_changes(self, added : list, removed : list, modified : list):
+        # image_files is shared with the caller, so the caller sees the changes too
+        present = set(self.image_files)
+        removed = present.intersection(removed)
+        added = [path for path in dict.fromkeys(added) if path not in present]
+
+        for path in removed.union(modified):
+            self.thumbnails.pop(path, None)
+            self.photos.pop(path, None)
+            self.requested.discard(path)
+        self.loader.cancel(list(removed.union(modified)))
+
+        if removed:
+            self.image_files[:] = [path for path in self.image_files if path not in removed]
+            self.selection.difference_update(removed)
+            self.anchor = None
+        self.image_files.extend(added)
+
+        self.canvas.configure(scrollregion=(0, 0, self.per_row * self.cell_width, self.rows() * self.cell_height))
+        self._release_visible()
+        self.update_visible()
+
+
+    def insert_image(self, index : int, path : str):
+        # image_files is shared with the caller, so the caller sees the insertion too
+        self.image_files.insert(index, path)
+        if self.anchor is not None and self.anchor >= index:
+            self.anchor += 1
+        self.canvas.configure(scrollregion=(0, 0, self.per_row * self.cell_width, self.rows() * self.cell_height))
+        self._release_visible()
+        self.update_visible()
+
+
+    def _update_pages(self, first_row : int, last_row : int):
+        page_rows = self.page_rows
+        wanted = range(first_row // page_rows, last_row // page_rows + 1)
+
+        for number in list(self.pages):
+            if number not in wanted:
+                page = self.pages.pop(number)
+                self.canvas.itemconfigure(page["item"], state="hidden")
+                self.dirty_pages.discard(number)
+                self.free_pages.append(page)
+
+        size = (self.per_row * self.cell_width, page_rows * self.cell_height)
+        for number in wanted:
+            if number in self.pages:
+                continue
+            page = self.free_pages.pop() if self.free_pages else None
+            if page is not None and page["image"].size != size:
+                self.canvas.delete(page["item"])
+                page = None
+            if page is None:
+                image = Image.new("RGB", size, self.background)
+                page = {"image": image, "photo": ImageTk.PhotoImage(image), "item": self.canvas.create_image(0, 0, anchor="nw")}
+            else:
+                page["image"].paste(self.background, (0, 0) + size)
+            self.canvas.coords(page["item"], 0, number * page_rows * self.cell_height)
+            self.canvas.itemconfigure(page["item"], image=page["photo"], state="normal")
+            self.canvas.tag_lower(page["item"])
+            self.pages[number] = page
+
+            first_position = number * page_rows * self.per_row
+            for position in range(first_position, min(self.count(), first_position + page_rows * self.per_row)):
+                self._paste_tile(position)
+            self._mark_dirty(number)
+
+
+    def _paste_tile(self, position : int, fill=None):
+        if fill is not None:
+            image = Image.new("RGB", (self.tile_size, self.tile_size), fill)
+        elif position < len(self.folders):
+            image = self.folder_image
+        else:
+            image = self.thumbnails.get(self.image_files[position - len(self.folders)])
+        if image is None:
+            return None
+
+        page_rows = self.page_rows
+        number = position // self.per_row // page_rows
+        page = self.pages.get(number)
+        if page is None:
+            return None
+
+        x, y = self.tile_origin(position)
+        y -= number * page_rows * self.cell_height
+        page["image"].paste(image, (x + self.border, y + self.border))
+        return number
+
+
+    def _mark_dirty(self, number : int):
+        self.dirty_pages.add(number)
+        if self._flush_job is None:
+            self._flush_job = self.canvas.after_idle(self._flush_pages)
+
+
+    def _flush_pages(self):
+        self._flush_job = None
+        for number in self.dirty_pages:
+            page = self.pages.get(number)
+            if page is not None:
+                page["photo"].paste(page["image"])
+        self.dirty_pages = set()
+
+
+    def _request_thumbnails(self):
+        offset = len(self.folders)
+        first_row, last_row = self._viewport_rows()
+        in_view = range(first_row * self.per_row, (last_row + 1) * self.per_row)
+
+        wanted = [position for position in self.visible_range
+                  if position >= offset and self.image_files[position - offset] not in self.thumbnails
+                  and self.image_files[position - offset] not in self.requested]
+        wanted.sort(key=lambda position: position not in in_view)
+        wanted = [self.image_files[position - offset] for position in wanted]
+
+        stale = [path for path in self.requested if path not in self.visible_paths]
+        self.loader.cancel(stale)
+        self.requested.difference_update(stale)
+
+        self.requested.update(wanted)
+        self.loader.submit(((path, path, self.tile_size) for path in wanted), cancel_previous=False)
+
+
+    def _on_thumbnail_loaded(self, path, result):
+        self.requested.discard(path)
+        position = self.visible_paths.get(path)
+        if position is None:
+            return
+
+        image, _ = result
+        self.thumbnails[path] = image
+        while len(self.thumbnails) > 2 * max(len(self.slots), 1):
+            self.thumbnails.popitem(last=False)
+
+        if self.atlas:
+            number = self._paste_tile(position)
+            if number is not None:
+                self._mark_dirty(number)
+        else:
+            self.canvas.itemconfigure(self.visible[position]["image"], image=self._tile_photo(path))
+
+
+    def position_at(self, x : float, y : float):
+        if x < 0 or y < 0:
+            return None
+        column, offset_x = divmod(int(x), self.cell_width)
+        row, offset_y = divmod(int(y), self.cell_height)
+        if column >= self.per_row:
+            return None
+        outer = self.tile_size + 2 * self.border
+        if not (self.pad_x <= offset_x < self.pad_x + outer and self.pad_y <= offset_y < self.pad_y + outer):
+            return None
+        position = row * self.per_row + column
+        if position >= self.count():
+            return None
+        return position
+
+
+    def positions_in(self, x0 : float, y0 : float, x1 : float, y1 : float):
+        x0, x1 = sorted((max(0, x0), max(0, x1)))
+        y0, y1 = sorted((max(0, y0), max(0, y1)))
+        first_column = int(x0 // self.cell_width)
+        last_column = min(self.per_row - 1, int(x1 // self.cell_width))
+        first_row = int(y0 // self.cell_height)
+        last_row = min(self.rows() - 1, int(y1 // self.cell_height))
+        total = self.count()
+        for row in range(first_row, last_row + 1):
+            for column in range(first_column, last_column + 1):
+                position = row * self.per_row + column
+                if position < total:
+                    yield position
+
+
+    def _event_point(self, event):
+        return self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
+
+
+    def _on_press(self, event, mode : str = "click"):
+        self.canvas.focus_set()
+        self.press = (self._event_point(event), mode)
+
+
+    def _on_drag(self, event):
+        if self.press is None:
+            return
+        (x0, y0), mode = self.press
+        x1, y1 = self._event_point(event)
+        if self.band is None:
+            if abs(x1 - x0) < self.drag_threshold and abs(y1 - y0) < self.drag_threshold:
+                return
+            self.band = self.canvas.create_rectangle(x0, y0, x1, y1, outline=self.selection_color, dash=(4, 2))
+
+        if event.y < 0:
+            self.canvas.yview_scroll(-1, "units")
+        elif event.y > self.canvas.winfo_height():
+            self.canvas.yview_scroll(1, "units")
+        x1, y1 = self._event_point(event)
+        self.canvas.coords(self.band, x0, y0, x1, y1)
+        self.canvas.tag_raise(self.band)
+
+
+    def _on_release(self, event):
+        if self.press is None:
+            return
+        (x0, y0), mode = self.press
+        self.press = None
+        offset = len(self.folders)
+
+        if self.band is not None:
+            self.canvas.delete(self.band)
+            self.band = None
+            x1, y1 = self._event_point(event)
+            paths = [self.image_files[position - offset] for position in self.positions_in(x0, y0, x1, y1) if position >= offset]
+            if mode == "toggle":
+                paths = self.selection.union(paths)
+            self.set_selection(paths, self.anchor)
+            return
+
+        position = self.position_at(x0, y0)
+        if position is None:
+            return
+        if position < offset:
+            if mode == "click":
+                self.on_folder_click(self.folders[position])
+            return
+
+        index = position - offset
+        path = self.image_files[index]
+        if mode == "range" and self.anchor is not None:
+            first, last = sorted((self.anchor, index))
+            self.set_selection(self.image_files[first:last + 1], self.anchor)
+        elif mode == "toggle":
+            self.set_selection(self.selection.symmetric_difference((path,)), index)
+        else:
+            self.selection = {path}
+            self.anchor = index
+            self._update_marks()
+            self.on_image_click(index)
@@ -0,0 +1,22 @@
+from PIL import Image
+
+
+REDUCIBLE_MODES = ("L", "RGB", "RGBA")
+
+
+def load_image(path : str, size : tuple) -> tuple:
+    image = Image.open(path)
+    source_size = image.size
+    width, height = size
+
+    if image.format == "JPEG":
+        image.draft(None, (width, height))
+
+    image.load()
+    factor = min(image.size[0] // width, image.size[1] // height)
+    if factor > 1 and image.mode in REDUCIBLE_MODES:
+        image = image.reduce(factor)
+
+    if image.size != (width, height):
+        image = image.resize((width, height))
+    return image, source_size
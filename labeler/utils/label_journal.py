@@ -0,0 +1,117 @@
+import os
+import json
+
+
+SET = "set"
+UNSET = "unset"
+
+
+def journal_path(labels_path : str) -> str:
+    return labels_path + ".journal"
+
+
+def apply_operation(labels : dict, operation : dict):
+    if operation["op"] == SET:
+        labels[operation["path"]] = operation["class"]
+    elif operation["op"] == UNSET:
+        labels.pop(operation["path"], None)
+
+
+def class_id(value):
+    # labels.json written before class ids became ints stores them as strings
+    if isinstance(value, str) and value.lstrip("-").isdigit():
+        return int(value)
+    return value
+
+
+def normalize_labels(labels : dict) -> dict:
+    for path, value in labels.items():
+        labels[path] = class_id(value)
+    return labels
+
+
+def read_labels(labels_path : str) -> dict:
+    # before the first compaction a new folder only has the journal
+    labels = {}
+    if os.path.exists(labels_path):
+        with open(labels_path, "r", encoding="utf-8") as f:
+            labels = json.load(f)
+    elif not os.path.exists(journal_path(labels_path)):
+        raise FileNotFoundError(labels_path)
+    LabelJournal(labels_path).replay(labels)
+    return normalize_labels(labels)
+
+
+def write_json_atomic(path : str, data):
+    if not isinstance(data, dict):
+        data = dict(data.items())
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+class LabelJournal:
+    def __init__(self, labels_path : str, compact_every : int = 1000):
+        self.labels_path = labels_path
+        self.journal_path = journal_path(labels_path)
+        self.compact_every = compact_every
+        self.pending = 0
+        self._file = None
+
+
+    def replay(self, labels : dict) -> int:
+        if not os.path.exists(self.journal_path):
+            return 0
+        replayed = 0
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    operation = json.loads(line)
+                except json.JSONDecodeError:
+                    # a torn line from a crash mid-append
+                    continue
+                apply_operation(labels, operation)
+                replayed += 1
+        self.pending = replayed
+        return replayed
+
+
+    def append(self, operations : list):
+        if not operations:
+            return
+        if self._file is None:
+            self._file = open(self.journal_path, "a", encoding="utf-8")
+            if self._file.tell() > 0 and not self._ends_with_newline():
+                self._file.write("\n")
+        self._file.write("".join(json.dumps(operation, ensure_ascii=False) + "\n" for operation in operations))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.pending += len(operations)
+
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.journal_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+
+    def needs_compaction(self) -> bool:
+        return self.pending >= self.compact_every
+
+
+    def compact(self, labels : dict):
+        write_json_atomic(self.labels_path, labels)
+        if self._file is not None:
+            self._file.truncate(0)
+        elif os.path.exists(self.journal_path):
+            open(self.journal_path, "w").close()
+        self.pending = 0
+
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -4,11 +4,15 @@ from random import choice
 from tkinter import IntVar, Label, Radiobutton, Button, Variable, messagebox, ttk
 from .colors import random_colors
 from .styles import widget_styles
+from .dir_index import directory_index
+from .label_store import open_label_store
 
 
 class LabelParser:
-    def __init__(self, root) -> None:
+    def __init__(self, root, store=None, on_saved=None) -> None:
         self.root = root
+        self.store = store
+        self.on_saved = on_saved
 
         self.formats = ["<Метка>_<Номер>", "<Номер>_<Метка>"]
 
@@ -21,12 +25,11 @@ class LabelParser:
 
     
     def _init_UI_files(self, folder : str):
-        supported_formats = (".png", ".jpg", ".jpeg", ".bmp", ".gif")
-        files = [file for file in os.listdir(folder) if file.lower().endswith(supported_formats)]
-        nested_folders = [os.path.join(folder, f) for f in os.listdir(folder) if os.path.isdir(os.path.join(folder, f))]
+        files = [os.path.basename(file) for file in directory_index.images(folder)]
+        nested_folders = directory_index.folders(folder)
         
         for d in nested_folders:
-            self.nested_files[d] = [os.path.relpath(os.path.join(d, f), folder) for f in os.listdir(d) if f.lower().endswith(supported_formats)]
+            self.nested_files[d] = [os.path.relpath(f, folder) for f in directory_index.images(d)]
 
         if files == [] and self.nested_files == {}:
             self.error_label = Label(self.root, foreground="red")
@@ -95,14 +98,25 @@ class LabelParser:
         self.save(self.labels_path, self.config_path)
 
         self.folder_label.config(text=f"Папка обработана\n{len(self.files) + sum(len(v) for v in self.nested_files.values())} изображений")
-        messagebox.showinfo("Успех", "Папка обработана. Перезапустите программу чтобы увидеть изменения.")
+        messagebox.showinfo("Успех", "Папка обработана.")
 
     
     def save(self, labels: str, config : str):
-        with open(labels, "w", encoding="utf-8") as f:
-            json.dump(self.labels, f, ensure_ascii=False, indent=4)
+        # the app's open store is reused so a second connection never rewrites labels behind it
+        if self.store is not None and self.store.labels_path == labels:
+            self.store.replace(self.labels)
+            self.store.set_classes(self.class_mapping)
+        else:
+            store = open_label_store(labels)
+            try:
+                store.replace(self.labels)
+                store.set_classes(self.class_mapping)
+            finally:
+                store.close()
         with open(config, "w", encoding="utf-8") as f:
             json.dump(self.class_mapping, f, ensure_ascii=False, indent=4)
+        if self.on_saved is not None:
+            self.on_saved()
     
 
     def parse_filenames(self, folder : str, labels : str, config : str):
@@ -112,13 +126,11 @@ class LabelParser:
 
     
     def parse_folders(self, folder : str, labels : str, config : str):
-        supported_formats = (".png", ".jpg", ".jpeg", ".bmp", ".gif")
         class_mapping = {}
-        nested_folders = [f for f in os.listdir(folder) if os.path.isdir(os.path.join(folder, f))]
+        nested_folders = [os.path.basename(f) for f in directory_index.folders(folder)]
         
         for d in nested_folders:
-            files = os.listdir(os.path.join(folder, d))
-            files = [os.path.join(d, f) for f in files if f.lower().endswith(supported_formats)]
+            files = [os.path.relpath(f, folder) for f in directory_index.images(os.path.join(folder, d))]
 
             self.label_map[d] = len(self.label_map)
 
@@ -135,5 +147,5 @@ class LabelParser:
 
         self.save(labels, config)
         
-        messagebox.showinfo("Успех", "Папка обработана. Перезапустите программу чтобы увидеть изменения.")
+        messagebox.showinfo("Успех", "Папка обработана.")
         
\ No newline at end of file
@@ -0,0 +1,236 @@
+import os
+import json
+import sqlite3
+from collections import Counter
+
+from .label_journal import LabelJournal, SET, UNSET, normalize_labels, read_labels as read_json_labels, write_json_atomic
+
+
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+
+
+def is_sqlite_path(labels_path : str) -> bool:
+    return labels_path.lower().endswith(SQLITE_EXTENSIONS)
+
+
+def open_label_store(labels_path : str):
+    if is_sqlite_path(labels_path):
+        return SqliteLabelStore(labels_path)
+    return JsonLabelStore(labels_path)
+
+
+def read_labels(labels_path : str) -> dict:
+    if not is_sqlite_path(labels_path):
+        return read_json_labels(labels_path)
+    if not os.path.exists(labels_path):
+        raise FileNotFoundError(labels_path)
+    store = SqliteLabelStore(labels_path)
+    try:
+        return store.load()
+    finally:
+        store.close()
+
+
+def label_counts(labels_path : str) -> dict:
+    if not is_sqlite_path(labels_path):
+        return dict(Counter(str(value) for value in read_json_labels(labels_path).values()))
+    if not os.path.exists(labels_path):
+        raise FileNotFoundError(labels_path)
+    store = SqliteLabelStore(labels_path)
+    try:
+        return store.counts()
+    finally:
+        store.close()
+
+
+def _file_signature(path : str):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class JsonLabelStore:
+    def __init__(self, labels_path : str, compact_every : int = 1000):
+        self.labels_path = labels_path
+        self.journal = LabelJournal(labels_path, compact_every)
+        self.signature = None
+
+
+    @property
+    def pending(self) -> int:
+        return self.journal.pending
+
+
+    def load(self) -> dict:
+        labels = {}
+        if os.path.exists(self.labels_path):
+            with open(self.labels_path, "r", encoding="utf-8") as f:
+                labels = json.load(f)
+        self.journal.replay(labels)
+        self.signature = _file_signature(self.labels_path)
+        return normalize_labels(labels)
+
+
+    def changed(self) -> bool:
+        return _file_signature(self.labels_path) != self.signature
+
+
+    def apply(self, operations : list):
+        self.journal.append(operations)
+
+
+    def needs_flush(self) -> bool:
+        return self.journal.needs_compaction()
+
+
+    def flush(self, labels : dict):
+        self.journal.compact(labels)
+        self.signature = _file_signature(self.labels_path)
+
+
+    def replace(self, labels : dict):
+        self.flush(labels)
+
+
+    def set_classes(self, class_mapping : dict):
+        pass
+
+
+    def remap(self, mapping : dict, labels):
+        self.flush(labels)
+
+
+    def counts(self) -> dict:
+        return dict(Counter(str(value) for value in self.load().values()))
+
+
+    def export_json(self, path : str, labels : dict = None):
+        write_json_atomic(path, self.load() if labels is None else labels)
+
+
+    def close(self):
+        self.journal.close()
+
+
+class SqliteLabelStore:
+    def __init__(self, labels_path : str, batch_size : int = 10000):
+        self.labels_path = labels_path
+        self.batch_size = batch_size
+        self.pending = 0
+        self.signature = None
+
+        self.connection = sqlite3.connect(labels_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(
+            "CREATE TABLE IF NOT EXISTS images ("
+            "id INTEGER PRIMARY KEY, "
+            "path TEXT NOT NULL UNIQUE);"
+            "CREATE TABLE IF NOT EXISTS classes ("
+            "id INTEGER PRIMARY KEY, "
+            "name TEXT NOT NULL, "
+            "color TEXT);"
+            "CREATE TABLE IF NOT EXISTS labels ("
+            "image_id INTEGER PRIMARY KEY REFERENCES images (id), "
+            "class_id INTEGER NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS labels_class ON labels (class_id);"
+        )
+        self.connection.commit()
+
+
+    def _data_version(self) -> int:
+        return self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+
+    def load(self) -> dict:
+        rows = self.connection.execute(
+            "SELECT images.path, labels.class_id FROM labels JOIN images ON images.id = labels.image_id"
+        )
+        labels = dict(rows)
+        self.signature = self._data_version()
+        return labels
+
+
+    def changed(self) -> bool:
+        # data_version only moves when another connection commits
+        return self._data_version() != self.signature
+
+
+    def upsert(self, items):
+        items = [(path, int(class_id)) for path, class_id in items]
+        for start in range(0, len(items), self.batch_size):
+            batch = items[start:start + self.batch_size]
+            self.connection.executemany("INSERT OR IGNORE INTO images (path) VALUES (?)", ((path,) for path, _ in batch))
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO labels (image_id, class_id) "
+                "VALUES ((SELECT id FROM images WHERE path = ?), ?)",
+                batch
+            )
+
+
+    def remove(self, paths):
+        self.connection.executemany(
+            "DELETE FROM labels WHERE image_id = (SELECT id FROM images WHERE path = ?)",
+            ((path,) for path in paths)
+        )
+
+
+    def apply(self, operations : list):
+        with self.connection:
+            self.upsert((operation["path"], operation["class"]) for operation in operations if operation["op"] == SET)
+            self.remove(operation["path"] for operation in operations if operation["op"] == UNSET)
+        self.signature = self._data_version()
+
+
+    def needs_flush(self) -> bool:
+        return False
+
+
+    def flush(self, labels : dict):
+        self.connection.commit()
+
+
+    def replace(self, labels : dict):
+        with self.connection:
+            self.connection.execute("DELETE FROM labels")
+            self.upsert(labels.items())
+        self.signature = self._data_version()
+
+
+    def set_classes(self, class_mapping : dict):
+        with self.connection:
+            self.connection.execute("DELETE FROM classes")
+            self.connection.executemany(
+                "INSERT INTO classes (id, name, color) VALUES (?, ?, ?)",
+                ((index, name, value.get("color")) for index, (name, value) in enumerate(class_mapping.items()))
+            )
+
+
+    def remap(self, mapping : dict, labels=None):
+        with self.connection:
+            self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS class_remap (old INTEGER PRIMARY KEY, new INTEGER NOT NULL)")
+            self.connection.execute("DELETE FROM class_remap")
+            self.connection.executemany("INSERT INTO class_remap (old, new) VALUES (?, ?)", mapping.items())
+            self.connection.execute("DELETE FROM labels WHERE class_id NOT IN (SELECT old FROM class_remap)")
+            self.connection.execute("UPDATE labels SET class_id = (SELECT new FROM class_remap WHERE old = labels.class_id) "
+                "WHERE class_id IN (SELECT old FROM class_remap WHERE old != new)")
+        self.signature = self._data_version()
+
+
+    def counts(self) -> dict:
+        rows = self.connection.execute("SELECT class_id, COUNT(*) FROM labels GROUP BY class_id")
+        return {str(class_id) : count for class_id, count in rows}
+
+
+    def import_json(self, json_path : str):
+        self.replace(read_json_labels(json_path))
+
+
+    def export_json(self, path : str, labels : dict = None):
+        write_json_atomic(path, self.load() if labels is None else labels)
+
+
+    def close(self):
+        self.connection.close()
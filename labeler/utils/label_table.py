@@ -0,0 +1,234 @@
+import numpy as np
+
+
+UNLABELED = -1
+
+
+def _hash(path : str) -> int:
+    return hash(path)
+
+
+class LabelTable:
+    # rows are never removed, unsetting a label writes UNLABELED so row ids stay stable
+    def __init__(self, merge_every : int = 4096):
+        self.merge_every = merge_every
+        self.directories = []
+        self.directory_ids = {}
+
+        self.size = 0
+        self.labeled = 0
+        self.classes = np.empty(0, dtype=np.int16)
+        self.dir_ids = np.empty(0, dtype=np.int32)
+        self.name_offsets = np.zeros(1, dtype=np.int64)
+        self.names = bytearray()
+
+        self.hashes = np.empty(0, dtype=np.int64)
+        self.order = np.empty(0, dtype=np.int32)
+        self.recent = {}
+
+
+    @classmethod
+    def from_items(cls, items):
+        table = cls()
+        if hasattr(items, "items"):
+            items = items.items()
+        paths, dir_ids, names, classes = [], [], [], []
+        for path, class_id in items:
+            directory, name = table._split(path)
+            paths.append(path)
+            dir_ids.append(table._directory_id(directory))
+            names.append(name.encode("utf-8"))
+            classes.append(int(class_id))
+
+        table.size = len(paths)
+        table.classes = np.array(classes, dtype=np.int16)
+        table.dir_ids = np.array(dir_ids, dtype=np.int32)
+        table.name_offsets = np.zeros(table.size + 1, dtype=np.int64)
+        np.cumsum([len(name) for name in names], out=table.name_offsets[1:])
+        table.names = bytearray(b"".join(names))
+        table.labeled = int(np.count_nonzero(table.classes != UNLABELED))
+
+        hashes = np.fromiter((_hash(path) for path in paths), dtype=np.int64, count=table.size)
+        table.order = np.argsort(hashes, kind="stable").astype(np.int32)
+        table.hashes = hashes[table.order]
+        return table
+
+
+    def _grow(self, count : int):
+        needed = self.size + count
+        if needed <= len(self.classes):
+            return
+        capacity = max(needed, 2 * len(self.classes), 1024)
+        self.classes = np.resize(self.classes, capacity)
+        self.dir_ids = np.resize(self.dir_ids, capacity)
+        self.name_offsets = np.resize(self.name_offsets, capacity + 1)
+
+
+    def _directory_id(self, directory : str) -> int:
+        directory_id = self.directory_ids.get(directory)
+        if directory_id is None:
+            directory_id = len(self.directories)
+            self.directories.append(directory)
+            self.directory_ids[directory] = directory_id
+        return directory_id
+
+
+    @staticmethod
+    def _split(path : str):
+        cut = max(path.rfind("/"), path.rfind("\\")) + 1
+        return path[:cut], path[cut:]
+
+
+    def _path(self, row : int) -> str:
+        start, end = self.name_offsets[row], self.name_offsets[row + 1]
+        return self.directories[self.dir_ids[row]] + self.names[start:end].decode("utf-8")
+
+
+    def _append(self, path : str, class_id : int) -> int:
+        directory, name = self._split(path)
+        self._grow(1)
+        row = self.size
+        encoded = name.encode("utf-8")
+        self.names += encoded
+        self.name_offsets[row + 1] = self.name_offsets[row] + len(encoded)
+        self.dir_ids[row] = self._directory_id(directory)
+        self.classes[row] = class_id
+        self.size += 1
+        self.recent[path] = row
+        if len(self.recent) >= self.merge_every:
+            self._merge()
+        return row
+
+
+    def _merge(self):
+        if not self.recent:
+            return
+        rows = np.fromiter(self.recent.values(), dtype=np.int32, count=len(self.recent))
+        hashes = np.fromiter((_hash(path) for path in self.recent), dtype=np.int64, count=len(self.recent))
+        sort = np.argsort(hashes)
+        positions = np.searchsorted(self.hashes, hashes[sort])
+        self.hashes = np.insert(self.hashes, positions, hashes[sort])
+        self.order = np.insert(self.order, positions, rows[sort])
+        self.recent = {}
+
+
+    def row(self, path : str):
+        row = self.recent.get(path)
+        if row is not None:
+            return row
+        path_hash = _hash(path)
+        index = int(np.searchsorted(self.hashes, path_hash))
+        while index < len(self.hashes) and self.hashes[index] == path_hash:
+            row = int(self.order[index])
+            if self._path(row) == path:
+                return row
+            index += 1
+        return None
+
+
+    def get(self, path : str, default=None):
+        row = self.row(path)
+        if row is None or self.classes[row] == UNLABELED:
+            return default
+        return int(self.classes[row])
+
+
+    def __getitem__(self, path : str) -> int:
+        class_id = self.get(path)
+        if class_id is None:
+            raise KeyError(path)
+        return class_id
+
+
+    def __setitem__(self, path : str, class_id):
+        class_id = int(class_id)
+        row = self.row(path)
+        if row is None:
+            self._append(path, class_id)
+            self.labeled += int(class_id != UNLABELED)
+            return
+        self.labeled += int(class_id != UNLABELED) - int(self.classes[row] != UNLABELED)
+        self.classes[row] = class_id
+
+
+    def __delitem__(self, path : str):
+        if self.pop(path, None) is None:
+            raise KeyError(path)
+
+
+    def pop(self, path : str, default=None):
+        row = self.row(path)
+        if row is None or self.classes[row] == UNLABELED:
+            return default
+        class_id = int(self.classes[row])
+        self.classes[row] = UNLABELED
+        self.labeled -= 1
+        return class_id
+
+
+    def __contains__(self, path : str) -> bool:
+        return self.get(path) is not None
+
+
+    def __len__(self) -> int:
+        return self.labeled
+
+
+    def __iter__(self):
+        return self.keys()
+
+
+    def keys(self):
+        for path, _ in self.items():
+            yield path
+
+
+    def values(self):
+        classes = self.classes[:self.size]
+        return iter(classes[classes != UNLABELED].tolist())
+
+
+    def items(self):
+        classes = self.classes[:self.size]
+        rows = np.flatnonzero(classes != UNLABELED)
+        starts = self.name_offsets[rows].tolist()
+        ends = self.name_offsets[rows + 1].tolist()
+        directories = [self.directories[i] for i in self.dir_ids[rows].tolist()]
+        names = bytes(self.names)
+        for directory, start, end, class_id in zip(directories, starts, ends, classes[rows].tolist()):
+            yield directory + names[start:end].decode("utf-8"), class_id
+
+
+    def update(self, items):
+        if hasattr(items, "items"):
+            items = items.items()
+        for path, class_id in items:
+            self[path] = class_id
+
+
+    def clear(self):
+        self.__init__(self.merge_every)
+
+
+    def remap(self, mapping : dict):
+        # mapping is old class id -> new class id, ids missing from it become unlabeled
+        if not self.size:
+            return
+        classes = self.classes[:self.size]
+        lookup = np.full(max(int(classes.max()), max(mapping, default=0)) + 1, UNLABELED, dtype=np.int16)
+        for old, new in mapping.items():
+            lookup[old] = new
+        labeled = classes != UNLABELED
+        classes[labeled] = lookup[classes[labeled]]
+        self.labeled = int(np.count_nonzero(classes != UNLABELED))
+
+
+    def counts(self, minlength : int = 0) -> np.ndarray:
+        classes = self.classes[:self.size]
+        return np.bincount(classes[classes != UNLABELED], minlength=minlength)
+
+
+    @property
+    def nbytes(self) -> int:
+        return (self.classes.nbytes + self.dir_ids.nbytes + self.name_offsets.nbytes + len(self.names)
+                + self.hashes.nbytes + self.order.nbytes + sum(len(d) for d in self.directories))
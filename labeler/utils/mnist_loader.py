@@ -62,6 +62,18 @@ def parse_idx(fname, target_dir):
         return data.reshape(dims)
 
 
+def write_idx(fname, target_dir, data : np.ndarray, chunk_rows : int = 4096):
+    # inverse of parse_idx, streams row chunks so memory-mapped arrays are never loaded whole
+    codes = {np.dtype('>' + code): dt for dt, code in idx_dt.items()}
+    dtype = np.dtype(data.dtype).newbyteorder('>') if data.dtype.itemsize > 1 else data.dtype
+    dt = codes[dtype]
+    with gzip.open(os.path.join(target_dir, fname), 'wb') as f:
+        f.write(struct.pack('>HBB', 0, dt, data.ndim))
+        f.write(struct.pack('>' + 'I'*data.ndim, *data.shape))
+        for start in range(0, len(data), chunk_rows):
+            f.write(np.ascontiguousarray(data[start:start + chunk_rows], dtype=dtype).tobytes())
+
+
 class MNIST(object):
     def __init__(self, kind: str, target_dir=None, clean_up=False, force=False):
         if target_dir is None:
@@ -0,0 +1,65 @@
+from collections import OrderedDict
+from PIL import ImageTk
+
+from .thumbnail_loader import ThumbnailLoader
+
+
+class PreviewCache:
+    def __init__(self, root, load, size : int, capacity : int = 32, prefetch : int = 3):
+        self.load = load
+        self.size = size
+        self.capacity = capacity
+        self.prefetch_count = prefetch
+        self.items = OrderedDict()
+        self.loader = ThumbnailLoader(root, load, self._on_loaded, workers=2)
+
+
+    def get(self, path : str):
+        item = self.items.get(path)
+        if item is None:
+            image, source_size = self.load(path, self.size)
+            item = self._put(path, image, source_size)
+        else:
+            self.items.move_to_end(path)
+
+        if item["photo"] is None:
+            item["photo"] = ImageTk.PhotoImage(item["image"])
+        return item["photo"], item["source_size"]
+
+
+    def _put(self, path : str, image, source_size : tuple):
+        item = {"image": image, "source_size": source_size, "photo": None}
+        self.items[path] = item
+        self.items.move_to_end(path)
+        while len(self.items) > self.capacity:
+            self.items.popitem(last=False)
+        return item
+
+
+    def _on_loaded(self, path, result):
+        if path not in self.items:
+            self._put(path, *result)
+
+
+    def prefetch(self, image_files : list, index : int):
+        neighbours = []
+        for offset in range(1, self.prefetch_count + 1):
+            for neighbour in (index + offset, index - offset):
+                if 0 <= neighbour < len(image_files) and image_files[neighbour] not in self.items:
+                    neighbours.append(image_files[neighbour])
+        self.loader.submit((path, path, self.size) for path in neighbours)
+
+
+    def invalidate(self, paths=None):
+        if paths is None:
+            self.loader.cancel()
+            self.items.clear()
+            return
+        self.loader.cancel(paths)
+        for path in paths:
+            self.items.pop(path, None)
+
+
+    def close(self):
+        self.loader.close()
+        self.items.clear()
@@ -1,19 +1,55 @@
 import os
-from tkinter import Label, Button, filedialog, Frame, Entry
-import cv2
-import json
-from numpy import around
+import hashlib
+import traceback
+from contextlib import ExitStack
+from tkinter import Label, Button, filedialog, Frame, Entry, Checkbutton, BooleanVar, StringVar, OptionMenu
 from datetime import datetime
+import numpy as np
+
+from .label_store import read_labels
+from .export_pool import ExportPool, COLOR_MODES, REDUCTIONS, decode_image, decode_targets
+from .export_writer import TxtWriter, CsvWriter, NpyWriter, ShardedWriter, COMPRESSORS, output_extension
+from .export_split import SPLITS, UNDERSAMPLE, OVERSAMPLE, split_plan, parse_ratios
+from .mnist_loader import write_idx
+from .feature_cache import FeatureCache
+
+
+def parse_resolutions(text : str) -> list:
+    # "28x28, 128x128" -> [(28, 28), (128, 128)]
+    resolutions = []
+    for item in text.replace(";", ",").replace(" ", ",").split(","):
+        if item:
+            width, height = item.lower().replace("х", "x").split("x")
+            resolutions.append((int(width), int(height)))
+    return resolutions
 
 
 class Scaler:
-    def __init__(self, outDir = 'out/', name = ""):
+    FEATURE_CACHE_NAME = ".features.db"
+
+    def __init__(self, outDir = 'out/', name = "", workers : int = None, chunk_size : int = 64, cache : bool = True):
         self.resolution = (64, 64)
+        self.colorMode = "gray"
+        self.targets = [(self.resolution, self.colorMode)]
+        self.cacheStats = None
+        self.shardStats = None
+        self.decodeStats = None
+        self.reduction = ""
+        self.cachePath = os.path.join(outDir, self.FEATURE_CACHE_NAME) if cache else None
         self.outDir = os.path.join(outDir, 'output')
         self.outputPath = ""
+        self.outputPaths = []
         self.outputName = name
+        self.imagesRoot = ""
         self.labelMap = {}
         self.labels = []
+        self.pool = ExportPool(workers, chunk_size)
+        self.compact = False
+        self.shardRows = 0
+        self.compression = ""
+        self.splitRatios = None
+        self.splitSeed = 0
+        self.balance = ""
 
         if not os.path.exists(self.outDir):
             os.makedirs(self.outDir)
@@ -24,103 +60,369 @@ class Scaler:
         self.labels = list(set([lable for lable in self.labelMap.values()]))
 
     
-    def set_resolution(self, resolution):
-        self.resolution = resolution
+    def set_resolution(self, resolution, modes : list = None):
+        # one (width, height) or a list of them, every resolution is exported in every colour mode
+        resolutions = [tuple(resolution)] if np.isscalar(resolution[0]) else [tuple(item) for item in resolution]
+        modes = [self.colorMode] if modes is None else list(modes)
+        for mode in modes:
+            if mode not in COLOR_MODES:
+                raise ValueError(f"Unknown colour mode: {mode}")
+        self.targets = [(resolution, mode) for resolution in resolutions for mode in modes]
+        self.resolution = resolutions[0]
+
+
+    def set_color_mode(self, mode : str):
+        if mode not in COLOR_MODES:
+            raise ValueError(f"Unknown colour mode: {mode}")
+        self.colorMode = mode
+        self.targets = [(resolution, mode) for resolution in dict.fromkeys(resolution for resolution, _ in self.targets)]
+
+
+    def set_workers(self, workers : int = None, chunk_size : int = None):
+        self.pool = ExportPool(workers, chunk_size or self.pool.chunk_size)
 
     
-    def process_image_txt(self, image_path : str):
-        image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-        
-        if image is None:
-            raise FileNotFoundError(f"Unable to load image: {image_path}.")
+    def set_cache(self, cache : bool):
+        self.cachePath = os.path.join(os.path.dirname(self.outDir), self.FEATURE_CACHE_NAME) if cache else None
+
 
-        resized_image = cv2.resize(image, self.resolution)
-        normalized_image = around(resized_image / 255.0, decimals=3)
-        image_name = "".join(os.path.splitext(os.path.basename(image_path)))
+    def set_reduction(self, reduction : str = ""):
+        # "quality" keeps the reduced JPEG decode at least twice the target size, "fast" only as large as the target
+        if reduction and reduction not in REDUCTIONS:
+            raise ValueError(f"Unknown reduction: {reduction}")
+        self.reduction = reduction
 
+
+    def _cache_mode(self, mode : str) -> str:
+        # gray converted from a colour decode and reduced decodes give slightly different pixels,
+        # so they are cached apart from plain grayscale decodes
+        if mode == "gray" and any(other != "gray" for _, other in self.targets):
+            mode = "gray/color"
+        return f"{mode}:{self.reduction}" if self.reduction else mode
+
+
+    def decoded_images(self, image_paths : list):
+        # yields (path, one image per target or None), a file is only decoded when some target misses the cache
+        self.cacheStats = None
+        self.decodeStats = None
+        if self.cachePath is None:
+            yield from self.pool.map(image_paths, self.targets, self.reduction)
+            self.decodeStats = (self.pool.full_pixels, self.pool.decoded_pixels)
+            return
+
+        cache = FeatureCache(self.cachePath)
         try:
-            labelName = self.labelMap[image_name]
-        except KeyError as e:
-            # print(f"Warning: File {e} not labeled.")
+            fresh = [cache.fresh(image_paths, resolution, self._cache_mode(mode)) for resolution, mode in self.targets]
+            cached = set.intersection(*fresh)
+            decoded = self.pool.map([path for path in image_paths if path not in cached], self.targets, self.reduction)
+            self.cacheStats = (len(cached), len(image_paths) - len(cached))
+            for image_path in image_paths:
+                if image_path in cached:
+                    images = [cache.get(image_path, resolution, self._cache_mode(mode)) for resolution, mode in self.targets]
+                    if any(image is None for image in images):
+                        images = decode_targets(image_path, self.targets, self.reduction)
+                else:
+                    _, images = next(decoded)
+                    for (resolution, mode), image, target_fresh in zip(self.targets, images or [], fresh):
+                        if image_path not in target_fresh:
+                            cache.put(image_path, resolution, self._cache_mode(mode), image)
+                yield image_path, images
+            decoded.close()
+            self.decodeStats = (self.pool.full_pixels, self.pool.decoded_pixels)
+        finally:
+            cache.close()
+
+
+    def set_compact(self, compact : bool):
+        self.compact = compact
+
+
+    def set_sharding(self, shard_rows : int = 0, compression : str = ""):
+        if compression and compression not in COMPRESSORS:
+            raise ValueError(f"Unknown compression: {compression}")
+        self.shardRows = max(0, shard_rows)
+        self.compression = compression
+
+
+    def set_split(self, ratios=None, seed : int = 0, balance : str = ""):
+        if balance not in {"", UNDERSAMPLE, OVERSAMPLE}:
+            raise ValueError(f"Unknown balancing mode: {balance}")
+        self.splitRatios = None if ratios is None else tuple(ratios)
+        self.splitSeed = seed
+        self.balance = balance
+
+
+    def _label_for(self, image_path : str):
+        return self.labelMap.get(os.path.relpath(image_path, self.imagesRoot or "."))
+
+
+    def labeled_images(self, images_root : str):
+        # labels are keyed by path relative to the images root, possibly written on another OS
+        entries = sorted(self.labelMap.items(), key=lambda entry: str(entry[0]))
+        paths = [os.path.join(images_root, *str(path).replace("\\", "/").split("/")) for path, _ in entries]
+        return paths, [label for _, label in entries]
+
+
+    def _compact(self, target : int = 0) -> bool:
+        # colour rows are always written as 0-255 integers, floats would triple already large text files
+        return self.compact or COLOR_MODES[self.targets[target][1]] > 1
+
+
+    def _txt_writer(self, mode : str = "w", path : str = None, target : int = 0):
+        return TxtWriter(path or self.outputPath, self.labels, compact=self._compact(target), mode=mode, compression=self.compression)
+
+
+    def _csv_header(self, target : int = 0) -> str:
+        (width, height), color_mode = self.targets[target]
+        if COLOR_MODES[color_mode] == 1:
+            return "label," + ",".join(f"{i}" for i in range(1, width * height + 1))
+        # rows are channel-last, so the channels of one pixel are adjacent: r1,g1,b1,r2,...
+        return "label," + ",".join(f"{channel}{i}" for i in range(1, width * height + 1) for channel in color_mode)
+
+
+    def _csv_writer(self, mode : str = "w", path : str = None, target : int = 0):
+        return CsvWriter(path or self.outputPath, self._csv_header(target), compact=self._compact(target), mode=mode, compression=self.compression)
+
+    
+    def process_image_txt(self, image_path : str):
+        labelName = self._label_for(image_path)
+        if labelName is None:
+            # print(f"Warning: File {image_path} not labeled.")
             return
+        with self._txt_writer("a") as writer:
+            self.write_image_txt(writer, image_path, decode_image(image_path, *self.targets[0], self.reduction), labelName)
 
-        with open(self.outputPath, "a") as output_file:
-            flattened_values = normalized_image.flatten()
-            output_file.write(" ".join(map(str, flattened_values)) + '\n')
-            output_file.write(" ".join(["1" if str(l) == str(labelName) else "0" for l in self.labels]) + '\n')
 
-        # print(f"Значения для {image_name} записаны в {self.outDir}")
+    def write_image_txt(self, writer, image_path : str, resized_image, labelName):
+        if resized_image is None:
+            if not os.path.isfile(image_path):
+                # labeled file was removed since labeling
+                return
+            raise FileNotFoundError(f"Unable to load image: {image_path}.")
+        writer.write(resized_image, labelName)
+
 
     def process_image_csv(self, image_path: str):
-        image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-        
-        if image is None:
+        labelName = self._label_for(image_path)
+        if labelName is None:
+            # print(f"Warning: File {image_path} not labeled.")
+            return
+        with self._csv_writer("a") as writer:
+            self.write_image_csv(writer, image_path, decode_image(image_path, *self.targets[0], self.reduction), labelName)
+
+
+    def write_image_csv(self, writer, image_path : str, resized_image, labelName):
+        if resized_image is None:
             raise FileNotFoundError(f"Unable to load image: {image_path}.")
+        writer.write(resized_image, labelName)
 
-        resized_image = cv2.resize(image, self.resolution)
-        normalized_image = around(resized_image / 255.0, decimals=3)
-        image_name = "".join(os.path.splitext(os.path.basename(image_path)))
 
+    def _write_image_csv_quietly(self, writer, image_path : str, resized_image, labelName):
         try:
-            labelName = self.labelMap[image_name]
-        except KeyError as e:
-            # print(f"Warning: File {e} not labeled.")
+            self.write_image_csv(writer, image_path, resized_image, labelName)
+        except Exception as e:
+            # print(f"Error processing {image_path}: {str(e)}")
+            pass
+
+
+    def _output_stem(self) -> str:
+        now = datetime.today().strftime('%Y_%m_%d_%H%M%S')
+        return os.path.join(self.outDir, f"{self.outputName}_{now}")
+
+
+    def _output_path(self, extension : str) -> str:
+        return f"{self._output_stem()}.{extension}"
+
+
+    def _labels_digest(self, image_files : list, labels : list) -> str:
+        digest = hashlib.sha1()
+        for image_path, labelName in zip(image_files, labels):
+            digest.update(f"{os.path.relpath(image_path, self.imagesRoot or '.')}\t{labelName}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+
+    def _split_names(self, splits : np.ndarray) -> dict:
+        # split index -> file suffix for every split that receives rows, no split means one unnamed output
+        if self.splitRatios is None:
+            return {0: ""}
+        return {int(split): f"_{SPLITS[split]}" for split in np.unique(splits)}
+
+
+    def _target_suffix(self, target : int) -> str:
+        if len(self.targets) == 1:
+            return ""
+        (width, height), mode = self.targets[target]
+        if len({mode for _, mode in self.targets}) == 1:
+            return f"_{width}x{height}"
+        return f"_{width}x{height}_{mode}"
+
+
+    def _outputs(self, splits : np.ndarray) -> dict:
+        # (target index, split index) -> file suffix
+        names = self._split_names(splits)
+        return {(target, split): self._target_suffix(target) + suffix for target in range(len(self.targets)) for split, suffix in names.items()}
+
+
+    def _write_rows(self, image_files : list, labels : list, indices : np.ndarray, splits : np.ndarray, writers : dict, write_row, skips : dict = None):
+        # every input is decoded once, its rows (several when oversampled) go to the writer of each target for its split
+        skips = skips or {}
+        decoded = self.decoded_images([image_files[index] for index in np.unique(indices).tolist()])
+        current = None
+        for index, split in zip(indices.tolist(), splits.tolist()):
+            if index != current:
+                image_path, images = next(decoded)
+                current = index
+            for target in range(len(self.targets)):
+                if skips.get((target, split)):
+                    skips[target, split] -= 1
+                    continue
+                writer = writers[target, split]
+                writer.advance()
+                write_row(writer, image_path, None if images is None else images[target], labels[index])
+        # running the generator to its end lets it record the decode statistics
+        next(decoded, None)
+
+
+    def _process_text(self, extension : str, input_folder : str, open_writer, write_row):
+        self.imagesRoot = input_folder
+        image_files, labels = self.labeled_images(input_folder)
+        if not image_files:
             return
 
-        flattened_values = normalized_image.flatten()
-        csv_line = f"{labelName}," + ",".join(map(str, flattened_values))
-        
-        with open(self.outputPath, "a") as output_file:
-            output_file.write(csv_line + '\n')
+        self.shardStats = None
+        indices, splits = split_plan(labels, self.splitRatios, self.splitSeed, self.balance)
+        outputs = self._outputs(splits)
+        if self.shardRows:
+            self._process_sharded(extension, image_files, labels, indices, splits, outputs, open_writer, write_row)
+            return
 
-        # print(f"Значения для {image_name} записаны в {self.outDir}")
+        stem = self._output_stem()
+        extension = output_extension(extension, self.compression)
+        paths = {key: f"{stem}{suffix}.{extension}" for key, suffix in outputs.items()}
+        self.outputPaths = list(paths.values())
+        self.outputPath = self.outputPaths[0]
+        with ExitStack() as stack:
+            writers = {key: stack.enter_context(open_writer(path, key[0])) for key, path in paths.items()}
+            self._write_rows(image_files, labels, indices, splits, writers, write_row)
+
+
+    def _process_sharded(self, extension : str, image_files : list, labels : list, indices : np.ndarray, splits : np.ndarray, outputs : dict, open_shard, write_row):
+        self.shardStats = None
+        digest = self._labels_digest(image_files, labels)
+        split = None if self.splitRatios is None else {"ratios": list(self.splitRatios), "seed": self.splitSeed, "balance": self.balance}
+        # directory names are stable so an interrupted export resumes after its last finished shard
+        directories = {key: os.path.join(self.outDir, f"{self.outputName}_{extension}{suffix}_shards") for key, suffix in outputs.items()}
+        self.outputPaths = list(directories.values())
+        self.outputPath = self.outputPaths[0]
+        with ExitStack() as stack:
+            writers = {}
+            for (target, split_index), directory in directories.items():
+                resolution, mode = self.targets[target]
+                settings = {
+                    "format": extension,
+                    "resolution": list(resolution),
+                    "mode": mode,
+                    "reduction": self.reduction,
+                    "compact": self._compact(target),
+                    "shard_rows": self.shardRows,
+                    "compression": self.compression,
+                    "split": split,
+                    "labels": digest,
+                }
+                writers[target, split_index] = stack.enter_context(ShardedWriter(
+                    directory, output_extension(extension, self.compression),
+                    lambda path, target=target: open_shard(path, target), self.shardRows, settings
+                ))
+
+            # an input is decoded again only if some target of its split has not written it yet
+            keep = np.ones(len(indices), dtype=bool)
+            skips = {}
+            for split_index in {key[1] for key in writers}:
+                rows = np.flatnonzero(splits == split_index)
+                done = {key: writer.skip for key, writer in writers.items() if key[1] == split_index}
+                first = min(done.values())
+                keep[rows[:first]] = False
+                skips.update({key: count - first for key, count in done.items()})
+            self._write_rows(image_files, labels, indices[keep], splits[keep], writers, write_row, skips)
+        self.shardStats = (sum(len(writer.manifest["shards"]) for writer in writers.values()), int(np.count_nonzero(~keep)))
+
+
+    def _write_image_npy(self, writer, image_path : str, resized_image, labelName):
+        if resized_image is not None:
+            writer.write(resized_image, labelName)
+
+
+    def _write_npy(self, stem : str, image_files : list, labels : list) -> dict:
+        # (target index, split index) -> (images path, labels path)
+        indices, splits = split_plan(labels, self.splitRatios, self.splitSeed, self.balance)
+        paths = {key: (f"{stem}{suffix}_images.npy", f"{stem}{suffix}_labels.npy") for key, suffix in self._outputs(splits).items()}
+        with ExitStack() as stack:
+            writers = {}
+            for (target, split), (images_path, labels_path) in paths.items():
+                (width, height), mode = self.targets[target]
+                shape = (height, width) if COLOR_MODES[mode] == 1 else (height, width, COLOR_MODES[mode])
+                writers[target, split] = stack.enter_context(NpyWriter(images_path, labels_path, int(np.count_nonzero(splits == split)), shape))
+            self._write_rows(image_files, labels, indices, splits, writers, self._write_image_npy)
+        return paths
 
 
     def process_folder_txt(self, input_folder : str):
-        supported_formats = (".png", ".jpg", ".jpeg", ".bmp", ".gif")
+        self._process_text("txt", input_folder, lambda path, target: self._txt_writer(path=path, target=target), self.write_image_txt)
 
-        if os.listdir(input_folder) == []:
+    def process_folder_csv(self, input_folder: str):
+        if not os.path.exists(input_folder):
             return
-        
-        now = datetime.today().strftime('%Y_%m_%d_%H%M%S')
-        txt_path = os.path.join(self.outDir, f"{self.outputName}_{now}.txt")
-        self.outputPath = txt_path
-        if not os.path.isfile(txt_path):
-            with open(txt_path, "w") as output_file:
-                output_file.write("")
+        self._process_text("csv", input_folder, lambda path, target: self._csv_writer(path=path, target=target), self._write_image_csv_quietly)
 
-        for file_name in os.listdir(input_folder):
-            if file_name.lower().endswith(supported_formats):
-                image_path = os.path.join(input_folder, file_name)
-                self.process_image_txt(image_path)
 
-    def process_folder_csv(self, input_folder: str):
-        supported_formats = (".png", ".jpg", ".jpeg", ".bmp", ".gif")
+    def process_folder_npy(self, input_folder : str):
+        self.imagesRoot = input_folder
+        image_files, labels = self.labeled_images(input_folder)
+        if not image_files:
+            return
+
+        paths = self._write_npy(self._output_stem(), image_files, labels)
+        self.outputPaths = [images_path for images_path, _ in paths.values()]
+        self.outputPath = self.outputPaths[0]
 
-        if not os.path.exists(input_folder) or not os.listdir(input_folder):
+
+    def process_folder_idx(self, input_folder : str):
+        self.imagesRoot = input_folder
+        image_files, labels = self.labeled_images(input_folder)
+        if not image_files:
             return
-        
-        now = datetime.today().strftime('%Y_%m_%d_%H%M%S')
-        csv_path = os.path.join(self.outDir, f"{self.outputName}_{now}.csv")
-        self.outputPath = csv_path
-        if not os.path.isfile(csv_path):
-            with open(csv_path, "w") as output_file:
-                width, height = self.resolution
-                header = "label," + ",".join(f"{i}" for i in range(1, width * height + 1))
-                output_file.write(header + '\n')
-
-        for file_name in os.listdir(input_folder):
-            if file_name.lower().endswith(supported_formats):
-                image_path = os.path.join(input_folder, file_name)
+
+        # decoded rows go through a memory-mapped .npy first because the idx header needs the final row count
+        paths = self._write_npy(self._output_stem(), image_files, labels)
+        self.outputPaths = []
+        try:
+            for images_path, labels_path in paths.values():
+                stem = images_path[:-len("_images.npy")]
+                images = np.load(images_path, mmap_mode="r")
                 try:
-                    self.process_image_csv(image_path)
-                except Exception as e:
-                    # print(f"Error processing {file_name}: {str(e)}")
-                    pass
+                    self.outputPaths.append(f"{stem}-images-idx{images.ndim}-ubyte.gz")
+                    write_idx(os.path.basename(self.outputPaths[-1]), self.outDir, images)
+                    write_idx(os.path.basename(f"{stem}-labels-idx1-ubyte.gz"), self.outDir, np.load(labels_path))
+                except BaseException as e:
+                    # the traceback keeps write_idx's frames, and with them the mapping, alive while the files are removed
+                    traceback.clear_frames(e.__traceback__)
+                    raise
+                finally:
+                    # Windows refuses to delete a file that is still memory-mapped
+                    del images
+        finally:
+            for images_path, labels_path in paths.values():
+                os.remove(images_path)
+                os.remove(labels_path)
+        self.outputPath = self.outputPaths[0]
 
 
 class ImageScaler:
-    def __init__(self, root, exportFormat : str, folderPath = "", labelsPath = "", name = ""):
+    COLOR_NAMES = {"gray": "оттенки серого", "rgb": "RGB", "rgba": "RGBA"}
+    BALANCE_NAMES = {"": "нет", UNDERSAMPLE: "уменьшить до меньшего класса", OVERSAMPLE: "дополнить до большего класса"}
+    REDUCTION_NAMES = {"": "нет", "quality": "без потери качества", "fast": "максимальная скорость"}
+
+    def __init__(self, root, exportFormat : str, folderPath = "", labelsPath = "", name = "", imagesPath = None, workers : int = None, chunk_size : int = 64):
         self.root = root
         self.name = name
         self.folder_label = Label(root)
@@ -128,12 +430,13 @@ class ImageScaler:
         self.error_label = Label(root, foreground="red")
         self.error_label.pack(pady=5)
 
-        self.sc = Scaler(outDir=folderPath, name=name)
+        self.sc = Scaler(outDir=folderPath, name=name, workers=workers, chunk_size=chunk_size)
 
         self.folder = folderPath
         self.labels = labelsPath
+        self.images = imagesPath if imagesPath else os.path.join(folderPath, "images")
 
-        if exportFormat not in {"txt", "csv"}:
+        if exportFormat not in {"txt", "csv", "npy", "idx"}:
             self.export_format = "txt"
         else:
             self.export_format = exportFormat
@@ -143,8 +446,7 @@ class ImageScaler:
 
     def initUI(self):
         try:
-            with open(self.labels, 'r', encoding='utf-8') as file:
-                self.sc.set_label_map(json.load(file))
+            self.sc.set_label_map(read_labels(self.labels))
         except Exception as e:
             self.error_label.config(text=f"Выбранная папка не содержит файл labels.json")
             self.error_label.config(foreground="red")
@@ -170,6 +472,56 @@ class ImageScaler:
         self.height_entry.insert(0, "64")
         self.height_entry.grid(row=1, column=2)
 
+        self.workers_label = Label(self.dimensions_frame, text="Процессы:")
+        self.workers_label.grid(row=2, column=0, pady=(5, 0))
+
+        self.workers_entry = Entry(self.dimensions_frame, width=10)
+        self.workers_entry.insert(0, str(self.sc.pool.workers))
+        self.workers_entry.grid(row=3, column=0)
+
+        self.extra_label = Label(self.dimensions_frame, text="Доп. разрешения:")
+        self.extra_label.grid(row=2, column=2, pady=(5, 0))
+
+        self.extra_entry = Entry(self.dimensions_frame, width=14)
+        self.extra_entry.grid(row=3, column=2)
+
+        Label(self.dimensions_frame, text="Каналы:").grid(row=4, column=0, pady=(5, 0))
+        self.color_var = StringVar(self.root, value=self.COLOR_NAMES[self.sc.colorMode])
+        OptionMenu(self.dimensions_frame, self.color_var, *self.COLOR_NAMES.values()).grid(row=4, column=1, columnspan=2, pady=(5, 0))
+
+        self.compact_check = BooleanVar(self.root, value=self.sc.compact)
+        Checkbutton(self.dimensions_frame, text="Целые значения 0-255", variable=self.compact_check).grid(row=5, column=0, columnspan=3, pady=(5, 0))
+
+        self.cache_check = BooleanVar(self.root, value=self.sc.cachePath is not None)
+        Checkbutton(self.dimensions_frame, text="Кэшировать обработанные изображения", variable=self.cache_check).grid(row=6, column=0, columnspan=3)
+
+        if self.export_format in {"txt", "csv"}:
+            Label(self.dimensions_frame, text="Строк в файле:").grid(row=7, column=0, pady=(5, 0))
+            self.shard_entry = Entry(self.dimensions_frame, width=10)
+            self.shard_entry.insert(0, str(self.sc.shardRows))
+            self.shard_entry.grid(row=8, column=0)
+
+            Label(self.dimensions_frame, text="Сжатие:").grid(row=7, column=2, pady=(5, 0))
+            self.compression_var = StringVar(self.root, value=self.sc.compression or "нет")
+            OptionMenu(self.dimensions_frame, self.compression_var, "нет", *COMPRESSORS).grid(row=8, column=2)
+
+        Label(self.dimensions_frame, text="Train/val/test:").grid(row=9, column=0, pady=(5, 0))
+        self.split_entry = Entry(self.dimensions_frame, width=10)
+        self.split_entry.grid(row=10, column=0)
+
+        Label(self.dimensions_frame, text="Зерно:").grid(row=9, column=2, pady=(5, 0))
+        self.seed_entry = Entry(self.dimensions_frame, width=10)
+        self.seed_entry.insert(0, str(self.sc.splitSeed))
+        self.seed_entry.grid(row=10, column=2)
+
+        Label(self.dimensions_frame, text="Балансировка классов:").grid(row=11, column=0, columnspan=3, pady=(5, 0))
+        self.balance_var = StringVar(self.root, value=self.BALANCE_NAMES[self.sc.balance])
+        OptionMenu(self.dimensions_frame, self.balance_var, *self.BALANCE_NAMES.values()).grid(row=12, column=0, columnspan=3)
+
+        Label(self.dimensions_frame, text="Уменьшенное декодирование JPEG:").grid(row=13, column=0, columnspan=3, pady=(5, 0))
+        self.reduction_var = StringVar(self.root, value=self.REDUCTION_NAMES[self.sc.reduction])
+        OptionMenu(self.dimensions_frame, self.reduction_var, *self.REDUCTION_NAMES.values()).grid(row=14, column=0, columnspan=3)
+
         self.dimensions_frame.pack(pady=10)
 
         self.process_button = Button(self.root, text="Экспорт", command=self.process_folder)
@@ -182,20 +534,87 @@ class ImageScaler:
             self.error_label.config(foreground="red")
             return
         
-        self.sc.set_resolution((int(self.width_entry.get()), int(self.height_entry.get())))
+        try:
+            extra = parse_resolutions(self.extra_entry.get())
+        except ValueError:
+            self.error_label.config(text="Укажите доп. разрешения, например 28x28, 128x128.")
+            self.error_label.config(foreground="red")
+            return
+        resolution = (int(self.width_entry.get()), int(self.height_entry.get()))
+        self.sc.set_color_mode(next(mode for mode, name in self.COLOR_NAMES.items() if name == self.color_var.get()))
+        self.sc.set_resolution(list(dict.fromkeys([resolution] + extra)))
+        if self.workers_entry.get().strip():
+            try:
+                workers = int(self.workers_entry.get())
+            except ValueError:
+                workers = 0
+            if workers < 1:
+                self.error_label.config(text="Укажите число процессов, не меньше 1.")
+                self.error_label.config(foreground="red")
+                return
+            self.sc.set_workers(workers)
+        self.sc.set_compact(self.compact_check.get())
+        self.sc.set_cache(self.cache_check.get())
+        if self.export_format in {"txt", "csv"}:
+            compression = self.compression_var.get()
+            try:
+                shard_rows = int(self.shard_entry.get() or 0)
+            except ValueError:
+                shard_rows = -1
+            if shard_rows < 0:
+                self.error_label.config(text="Укажите число строк в файле, 0 - без разбиения на файлы.")
+                self.error_label.config(foreground="red")
+                return
+            self.sc.set_sharding(shard_rows, "" if compression == "нет" else compression)
 
         try:
-            folder = os.path.join(self.folder, "images")
+            ratios = parse_ratios(self.split_entry.get())
+        except ValueError:
+            self.error_label.config(text="Укажите доли разбиения, например 80/10/10.")
+            self.error_label.config(foreground="red")
+            return
+        try:
+            seed = int(self.seed_entry.get() or 0)
+        except ValueError:
+            seed = -1
+        if seed < 0:
+            self.error_label.config(text="Укажите зерно разбиения - целое число не меньше 0.")
+            self.error_label.config(foreground="red")
+            return
+        balance = next(mode for mode, name in self.BALANCE_NAMES.items() if name == self.balance_var.get())
+        self.sc.set_split(ratios, seed, balance)
+        self.sc.set_reduction(next(mode for mode, name in self.REDUCTION_NAMES.items() if name == self.reduction_var.get()))
+
+        # an export that finds nothing to write leaves the list empty, paths from the previous export must not show
+        self.sc.outputPaths = []
+        try:
+            folder = self.images
             if self.export_format == "txt":
                 self.sc.process_folder_txt(folder)
             elif self.export_format == "csv":
                 self.sc.process_folder_csv(folder)
+            elif self.export_format == "npy":
+                self.sc.process_folder_npy(folder)
+            elif self.export_format == "idx":
+                self.sc.process_folder_idx(folder)
             else:
                 return
         except Exception as e:
             self.error_label.config(text=f"Произошла ошибка: {str(e)}")
             self.error_label.config(foreground="red")
             return
+        if not self.sc.outputPaths:
+            self.error_label.config(text="Нет размеченных изображений.")
+            self.error_label.config(foreground="red")
+            return
 
-        self.error_label.config(text=f"Папка успешно обработана.\nРезультаты сохранены в /{self.name}.{self.export_format}")
+        summary = f"Папка успешно обработана.\nРезультаты сохранены в {', '.join(os.path.basename(path) for path in self.sc.outputPaths)}"
+        if self.sc.shardStats is not None:
+            summary += f"\nФайлов: {self.sc.shardStats[0]}, пропущено готовых изображений: {self.sc.shardStats[1]}"
+        if self.sc.decodeStats is not None and self.sc.decodeStats[1] and self.sc.reduction:
+            full_pixels, decoded_pixels = self.sc.decodeStats
+            summary += f"\nДекодировано пикселей: {decoded_pixels} из {full_pixels} (в {full_pixels / decoded_pixels:.1f} раз меньше)"
+        if self.sc.cacheStats is not None:
+            summary += f"\nИз кэша: {self.sc.cacheStats[0]}, обработано: {self.sc.cacheStats[1]}"
+        self.error_label.config(text=summary)
         self.error_label.config(foreground="green")
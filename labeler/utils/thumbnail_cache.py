@@ -0,0 +1,136 @@
+import io
+import os
+import sqlite3
+import threading
+from PIL import Image
+
+from .image_loader import load_image
+
+
+class ThumbnailCache:
+    def __init__(self, db_path : str, commit_every : int = 64):
+        self.db_path = db_path
+        self.commit_every = commit_every
+        self._pending = 0
+        self._lock = threading.Lock()
+
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS thumbnails ("
+            "path TEXT NOT NULL, "
+            "size INTEGER NOT NULL, "
+            "folder TEXT NOT NULL, "
+            "mtime INTEGER NOT NULL, "
+            "file_size INTEGER NOT NULL, "
+            "width INTEGER NOT NULL, "
+            "height INTEGER NOT NULL, "
+            "data BLOB NOT NULL, "
+            "PRIMARY KEY (path, size))"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS thumbnails_folder ON thumbnails (folder)")
+        self.connection.commit()
+
+
+    @staticmethod
+    def _key(path : str) -> str:
+        return os.path.normcase(os.path.abspath(path))
+
+
+    @staticmethod
+    def _encode(image : Image.Image) -> bytes:
+        if image.mode not in ("RGB", "RGBA", "L", "LA", "P"):
+            image = image.convert("RGBA")
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG", compress_level=1)
+        return buffer.getvalue()
+
+
+    def get(self, path : str, size : int, stat : os.stat_result = None):
+        if stat is None:
+            stat = os.stat(path)
+        key = self._key(path)
+
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT mtime, file_size, width, height, data FROM thumbnails WHERE path = ? AND size = ?",
+                (key, size)
+            ).fetchone()
+            if row is None:
+                return None
+            mtime, file_size, width, height, data = row
+            if mtime != stat.st_mtime_ns or file_size != stat.st_size:
+                self.connection.execute("DELETE FROM thumbnails WHERE path = ?", (key,))
+                self._commit_if_needed(force=True)
+                return None
+
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        return image, (width, height)
+
+
+    def put(self, path : str, size : int, image : Image.Image, source_size : tuple, stat : os.stat_result = None):
+        if stat is None:
+            stat = os.stat(path)
+        key = self._key(path)
+        data = self._encode(image)
+
+        with self._lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO thumbnails (path, size, folder, mtime, file_size, width, height, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, size, os.path.dirname(key), stat.st_mtime_ns, stat.st_size, source_size[0], source_size[1], data)
+            )
+            self._pending += 1
+            self._commit_if_needed()
+
+
+    def load(self, path : str, size : int):
+        stat = os.stat(path)
+        cached = self.get(path, size, stat)
+        if cached is not None:
+            return cached
+
+        image, source_size = load_image(path, (size, size))
+        self.put(path, size, image, source_size, stat)
+        return image, source_size
+
+
+    def evict(self, paths : list):
+        keys = [(self._key(path),) for path in paths]
+        if not keys:
+            return
+        with self._lock:
+            self.connection.executemany("DELETE FROM thumbnails WHERE path = ?", keys)
+            self._commit_if_needed(force=True)
+
+
+    def evict_stale(self, folder : str, image_files : list):
+        folder_key = self._key(folder)
+        present = {self._key(path) for path in image_files}
+
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT DISTINCT path FROM thumbnails WHERE folder = ?", (folder_key,)
+            ).fetchall()
+            stale = [(path,) for (path,) in rows if path not in present]
+            if stale:
+                self.connection.executemany("DELETE FROM thumbnails WHERE path = ?", stale)
+                self._commit_if_needed(force=True)
+
+
+    def _commit_if_needed(self, force=False):
+        if force or self._pending >= self.commit_every:
+            self.connection.commit()
+            self._pending = 0
+
+
+    def flush(self):
+        with self._lock:
+            self._commit_if_needed(force=True)
+
+
+    def close(self):
+        self.flush()
+        self.connection.close()
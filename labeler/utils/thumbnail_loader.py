@@ -0,0 +1,97 @@
+import os
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ThumbnailLoader:
+    def __init__(self, root, load, on_loaded, on_idle=None, workers : int = None, poll_interval : int = 20, frame_budget : float = 0.015):
+        self.root = root
+        self.load = load
+        self.on_loaded = on_loaded
+        self.on_idle = on_idle
+        self.poll_interval = poll_interval
+        self.frame_budget = frame_budget
+
+        self.executor = ThreadPoolExecutor(max_workers=workers or min(8, os.cpu_count() or 1))
+        self.results = queue.Queue()
+        self.generation = 0
+        self.futures = {}
+        self.outstanding = 0
+        self._poll_job = None
+
+
+    def submit(self, jobs, cancel_previous=True):
+        if cancel_previous:
+            self.cancel()
+        generation = self.generation
+        for key, path, size in jobs:
+            self.futures[key] = self.executor.submit(self._work, generation, key, path, size)
+            self.outstanding += 1
+        self._schedule_poll()
+
+
+    def _work(self, generation, key, path, size):
+        if generation != self.generation:
+            self.results.put((generation, key, None))
+            return
+        try:
+            result = self.load(path, size)
+        except Exception:
+            result = None
+        self.results.put((generation, key, result))
+
+
+    def cancel(self, keys=None):
+        if keys is None:
+            self.generation += 1
+            for future in self.futures.values():
+                future.cancel()
+            self.futures = {}
+            self.outstanding = 0
+            return
+
+        for key in keys:
+            future = self.futures.pop(key, None)
+            if future is not None and future.cancel():
+                self.outstanding -= 1
+
+
+    def busy(self) -> bool:
+        return self.outstanding > 0
+
+
+    def _schedule_poll(self):
+        if self._poll_job is None:
+            self._poll_job = self.root.after(self.poll_interval, self._poll)
+
+
+    def _poll(self):
+        self._poll_job = None
+        deadline = time.perf_counter() + self.frame_budget
+
+        while time.perf_counter() < deadline:
+            try:
+                generation, key, result = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if generation != self.generation:
+                continue
+            self.outstanding -= 1
+            if key in self.futures and self.futures[key].done():
+                del self.futures[key]
+            if result is not None:
+                self.on_loaded(key, result)
+
+        if self.outstanding > 0 or not self.results.empty():
+            self._schedule_poll()
+        elif self.on_idle is not None:
+            self.on_idle()
+
+
+    def close(self):
+        self.cancel()
+        if self._poll_job is not None:
+            self.root.after_cancel(self._poll_job)
+            self._poll_job = None
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,220 @@
+import os
+import sys
+import struct
+import select
+import ctypes
+import ctypes.util
+import threading
+
+from .dir_index import SUPPORTED_FORMATS
+
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+INOTIFY_EVENT = struct.Struct("iIII")
+
+ADDED = "added"
+REMOVED = "removed"
+MODIFIED = "modified"
+RESCAN = "rescan"
+
+
+def merge_change(previous, current):
+    if previous is None:
+        return current
+    if previous == ADDED:
+        if current == REMOVED:
+            return None
+        return ADDED
+    if previous == REMOVED and current == ADDED:
+        return MODIFIED
+    return current
+
+
+def _load_inotify():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class InotifyBackend:
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, libc, folder : str, emit):
+        self.folder = folder
+        self.emit = emit
+        self.stopped = threading.Event()
+
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), self.MASK) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {folder}")
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+
+    def _run(self):
+        while not self.stopped.is_set():
+            ready, _, _ = select.select([self.fd], [], [], 0.5)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            except OSError:
+                break
+            self._parse(data)
+        os.close(self.fd)
+
+
+    def _parse(self, data : bytes):
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            _, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                self.emit(self.folder, RESCAN)
+            elif mask & (IN_CREATE | IN_MOVED_TO):
+                self.emit(os.path.join(self.folder, name), ADDED)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self.emit(os.path.join(self.folder, name), REMOVED)
+            elif mask & IN_CLOSE_WRITE:
+                self.emit(os.path.join(self.folder, name), MODIFIED)
+
+
+    def stop(self):
+        self.stopped.set()
+
+
+class PollingBackend:
+    def __init__(self, folder : str, emit, interval : float = 2.0):
+        self.folder = folder
+        self.emit = emit
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.snapshot = self._scan()
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+
+    def _scan(self) -> dict:
+        snapshot = {}
+        try:
+            with os.scandir(self.folder) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir():
+                            continue
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    snapshot[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            pass
+        return snapshot
+
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            snapshot = self._scan()
+            for path, signature in snapshot.items():
+                previous = self.snapshot.get(path)
+                if previous is None:
+                    self.emit(path, ADDED)
+                elif previous != signature:
+                    self.emit(path, MODIFIED)
+            for path in self.snapshot.keys() - snapshot.keys():
+                self.emit(path, REMOVED)
+            self.snapshot = snapshot
+
+
+    def stop(self):
+        self.stopped.set()
+
+
+class FolderWatcher:
+    def __init__(self, root, on_changes, coalesce_interval : int = 300, poll_interval : float = 2.0):
+        self.root = root
+        self.on_changes = on_changes
+        self.coalesce_interval = coalesce_interval
+        self.poll_interval = poll_interval
+
+        self.libc = _load_inotify()
+        self.backend = None
+        self.folder = None
+        self.pending = {}
+        self._lock = threading.Lock()
+        self._flush_job = None
+
+
+    def watch(self, folder : str):
+        if folder == self.folder and self.backend is not None:
+            return
+        self.stop()
+        self.folder = folder
+
+        if self.libc is not None:
+            try:
+                self.backend = InotifyBackend(self.libc, folder, self._emit)
+            except OSError:
+                self.backend = None
+        if self.backend is None:
+            self.backend = PollingBackend(folder, self._emit, self.poll_interval)
+        self._flush_job = self.root.after(self.coalesce_interval, self._flush)
+
+
+    def _emit(self, path : str, change : str):
+        if change == RESCAN:
+            if path != self.folder:
+                return
+        elif os.path.dirname(path) != self.folder or not path.lower().endswith(SUPPORTED_FORMATS):
+            return
+        with self._lock:
+            merged = merge_change(self.pending.pop(path, None), change)
+            if merged is not None:
+                self.pending[path] = merged
+
+
+    def _flush(self):
+        with self._lock:
+            pending, self.pending = self.pending, {}
+        self._flush_job = self.root.after(self.coalesce_interval, self._flush)
+
+        if pending:
+            added = [path for path, change in pending.items() if change == ADDED]
+            removed = [path for path, change in pending.items() if change == REMOVED]
+            modified = [path for path, change in pending.items() if change == MODIFIED]
+            self.on_changes(self.folder, added, removed, modified, RESCAN in pending.values())
+
+
+    def stop(self):
+        if self.backend is not None:
+            self.backend.stop()
+            self.backend = None
+        if self._flush_job is not None:
+            self.root.after_cancel(self._flush_job)
+            self._flush_job = None
+        with self._lock:
+            self.pending = {}
+        self.folder = None
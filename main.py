@@ -1,3 +1,4 @@
+from multiprocessing import freeze_support
 from tkinter import Tk
 from labeler.app import ImageLabelerApp
 
@@ -7,4 +8,5 @@ def main():
     root.mainloop()
 
 if __name__ == "__main__":
+    freeze_support()
     main()
\ No newline at end of file